@@ -0,0 +1,380 @@
+# used in the framing and the transforms
+import numpy as np
+
+# used in the whole-signal spectrum, pitch and roughness
+import spectral
+
+# used in the bark length and interbark interval
+import segmenter
+
+# used in centering 8-bit audio
+import audio
+
+# used to obtain project constants
+import constants
+
+# used in obtaining arguments (comparison)
+import sys
+
+# frames of the short-time analysis (librosa's defaults, as used by spectral_centroid in preprocess.py)
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# frames transformed at a time (small enough for their float64 copies to stay in cache)
+STFT_BATCH_FRAMES = 128
+
+'''------------------------------------
+FRAMING:
+    the short-time frames every centroid is computed from (here and in stream.py)
+    frame_padding() receives the time series, returns it padded at both ends for centered frames
+    frame_magnitudes() receives a padded time series, returns the magnitudes of every complete frame
+    in it (one every HOP_LENGTH samples from its first sample)
+    frame_centroids() receives the magnitudes of frames and the bin frequencies, returns their centroids
+------------------------------------'''
+def frame_padding(y):
+    # (numpy keeps reflecting series shorter than the padding, an empty one is padded with zeros)
+    return np.pad(y, N_FFT // 2, mode='reflect' if len(y) > 1 else 'constant')
+
+def frame_count(length):
+    if length < N_FFT:
+        return 0
+    return 1 + (length - N_FFT) // HOP_LENGTH
+
+def frame_magnitudes(y):
+    frames = frame_count(len(y))
+    window = np.hanning(N_FFT + 1)[:-1]
+
+    magnitudes = np.empty((frames, N_FFT // 2 + 1))
+    # a few frames at a time, so the framed copy of the time series stays small
+    # (the samples keep their type, only the frames being transformed are float64)
+    for first in range(0, frames, STFT_BATCH_FRAMES):
+        idx = np.arange(N_FFT)[None, :] + HOP_LENGTH * np.arange(first, min(first + STFT_BATCH_FRAMES, frames))[:, None]
+        magnitudes[first:first + len(idx)] = np.abs(np.fft.rfft(y[idx] * window, axis=1))
+
+    return magnitudes
+
+def frame_frequencies(sr):
+    return np.fft.rfftfreq(N_FFT, 1.0 / sr)
+
+def frame_centroids(magnitudes, freqs):
+    total = magnitudes.sum(axis=1)
+
+    # silent frames have a centroid of 0 (like librosa)
+    cent = np.zeros(len(magnitudes))
+    np.divide(magnitudes.dot(freqs), total, out=cent, where=total > 0)
+    return cent
+
+'''------------------------------------
+FRAME PEAKS:
+    receives the magnitudes of frames and the bin frequencies (see SignalAnalysis.stft),
+    returns the frequency of the highest peak of every frame and the power of every frame
+    (the peak is placed between the bins with a parabola through the log magnitudes
+    of the peak bin and its two neighbours)
+------------------------------------'''
+def frame_peaks(magnitudes, freqs):
+    rows = np.arange(len(magnitudes))
+
+    peak = np.argmax(magnitudes, axis=1)
+    # the first and last bins have only one neighbour, they are not interpolated
+    inner = np.clip(peak, 1, magnitudes.shape[1] - 2)
+
+    # smallest magnitude considered (keeps the log finite)
+    tiny = np.finfo(np.float64).tiny
+    alpha = np.log(magnitudes[rows, inner - 1] + tiny)
+    beta = np.log(magnitudes[rows, inner] + tiny)
+    gamma = np.log(magnitudes[rows, inner + 1] + tiny)
+
+    curvature = alpha - 2 * beta + gamma
+    offset = np.zeros(len(magnitudes))
+    valid = (curvature < 0) & (peak == inner)
+    offset[valid] = 0.5 * (alpha[valid] - gamma[valid]) / curvature[valid]
+    np.clip(offset, -0.5, 0.5, out=offset)
+
+    # the power of a frame is the sum of its squared magnitudes
+    power = np.einsum('ij,ij->i', magnitudes, magnitudes)
+
+    return (peak + offset) * freqs[1], power
+
+'''------------------------------------
+FRAME PITCH:
+    receives the frame peaks and powers (see frame_peaks) and how far under the loudest frame
+    a frame can be (dB, constants.PITCH_TOP_DB by default),
+    returns the median of the frame peaks of the loud frames (0.0 if the series is silent)
+    (the cost per frame is fixed, however long the split is)
+------------------------------------'''
+def median_peak(frequencies, power, top_db=None):
+    if top_db is None:
+        top_db = constants.PITCH_TOP_DB
+
+    if len(power) == 0 or np.max(power) <= 0:
+        return 0.0
+
+    loud = power >= np.max(power) * 10 ** (-top_db / 10.0)
+    return float(np.median(frequencies[loud]))
+
+'''------------------------------------
+STREAMED FRAMES:
+    the same frames as SignalAnalysis.stft, from a time series given a block at a time
+    update() receives the next block, returns the magnitudes of the frames it completes
+    finish() returns the magnitudes of the last frames (the ones that reach into the end padding)
+
+    only the samples of the frame being filled are kept
+------------------------------------'''
+class FrameStream:
+    def __init__(self):
+        # samples (padded at the start once there are enough of them) not yet in a complete frame
+        self.buffer = None
+        self.padded = False
+
+    def update(self, block):
+        if self.buffer is None:
+            self.buffer = block[:0]
+        self.buffer = np.concatenate([self.buffer, block])
+
+        # the reflected start needs the first N_FFT // 2 + 1 samples
+        if not self.padded:
+            if len(self.buffer) <= N_FFT // 2:
+                return np.zeros((0, N_FFT // 2 + 1))
+            self.buffer = np.concatenate([self.buffer[N_FFT // 2:0:-1], self.buffer])
+            self.padded = True
+
+        return self.frames()
+
+    def frames(self):
+        magnitudes = frame_magnitudes(self.buffer)
+        self.buffer = self.buffer[len(magnitudes) * HOP_LENGTH:]
+        return magnitudes
+
+    def finish(self):
+        if self.buffer is None:
+            self.buffer = np.zeros(0, dtype=np.float32)
+
+        # series too short to be padded a block at a time are padded as a whole
+        if not self.padded:
+            return frame_magnitudes(frame_padding(self.buffer))
+
+        # the reflected end only needs the last N_FFT // 2 + 1 samples, which are always kept
+        self.buffer = np.concatenate([self.buffer, self.buffer[-2:-(N_FFT // 2) - 2:-1]])
+        return self.frames()
+
+'''------------------------------------
+SIGNAL ANALYSIS:
+    the framed analysis of one time series (a recording or a split)
+    receives the time series (data, integer pcm or float) and its sample rate (sr)
+
+    every intermediate is computed the first time it is needed and then kept:
+        energy()        running sum of the squared samples (frame and window energies come from it)
+        above()         indices of the samples over a threshold (onsets)
+        spectrum()      amplitude spectrum of the whole time series (pitch, roughness)
+        stft()          magnitudes of the short-time frames (centroid, frame pitch)
+    so a new feature only costs a reduction over one of them
+------------------------------------'''
+class SignalAnalysis:
+    def __init__(self, data, sr):
+        self.data = data
+        self.sr = sr
+        self.cache = {}
+
+    # computes a value once (by name and arguments) and keeps it
+    def cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    # - - TIME DOMAIN - -
+
+    def energy(self):
+        def compute():
+            # one float64 array: the squares are written into it and summed in place
+            energy = np.empty(len(self.data) + 1)
+            energy[0] = 0.0
+
+            squares = audio.centered(self.data, energy[1:])
+            squares *= squares
+            np.cumsum(squares, out=squares)
+
+            return energy
+        return self.cached('energy', compute)
+
+    def above(self, threshold):
+        return self.cached(('above', threshold), lambda: np.flatnonzero(audio.signed(self.data) > threshold))
+
+    # loudness (dBFS) of the window_ms window starting at every millisecond
+    def envelope(self, window_ms):
+        return self.cached(('envelope', window_ms),
+            lambda: segmenter.loudness_envelope(self.data, self.sr, window_ms, self.energy()))
+
+    def chunk_lengths(self, min_silence_len, silence_thresh, keep_silence):
+        return self.cached(('chunks', min_silence_len, silence_thresh, keep_silence),
+            lambda: segmenter.envelope_chunk_lengths(self.envelope(min_silence_len), self.sr,
+                min_silence_len, silence_thresh, keep_silence))
+
+    def interbark_intervals(self):
+        def compute():
+            threshold = segmenter.ibi_threshold(self.data)
+            return segmenter.interbark_intervals(self.data, self.sr, self.above(threshold))
+        return self.cached('ibi', compute)
+
+    # - - WHOLE-SIGNAL SPECTRUM - -
+
+    def spectrum(self):
+        return self.cached('spectrum', lambda: spectral.amplitude_spectrum(self.data, self.sr))
+
+    def pitch_roughness(self):
+        return self.cached('pitch_roughness', lambda: spectral.spectral_features(*self.spectrum()))
+
+    # - - SHORT-TIME SPECTRUM - -
+
+    '''------------------------------------
+    SHORT-TIME SPECTRUM:
+        returns the magnitudes of the frames (frames x frequency bins) and the bin frequencies
+        (hann window, frames centered on every HOP_LENGTH samples with reflected edges,
+        like librosa's stft in the pinned version)
+    ------------------------------------'''
+    def stft(self):
+        return self.cached('stft', lambda: (frame_magnitudes(frame_padding(self.data)), frame_frequencies(self.sr)))
+
+    def centroid(self):
+        return self.cached('centroid', lambda: frame_centroids(*self.stft()))
+
+    def centroid_range(self):
+        cent = self.centroid()
+        return np.min(cent), np.max(cent)
+
+    # frequency of the highest peak and power of every frame (see frame_peaks)
+    def frame_peaks(self):
+        return self.cached('frame_peaks', lambda: frame_peaks(*self.stft()))
+
+    # median of the frame peaks of the loud frames (see median_peak)
+    def frame_pitch(self, top_db=None):
+        if top_db is None:
+            top_db = constants.PITCH_TOP_DB
+        return self.cached(('frame_pitch', top_db), lambda: median_peak(*self.frame_peaks(), top_db=top_db))
+
+
+'''------------------------------------
+SYNTHETIC PITCHED BARKS:
+    receives a random seed, sample rate and duration (in seconds),
+    returns a noisy time series of harmonic barks (each with its own pitch, bent a few percent)
+    and the median pitch of the barks while they are loud (what the pitch should be)
+------------------------------------'''
+def pitched_barks(seed, sr=22050, seconds=2.0):
+    rng = np.random.RandomState(seed)
+    y = rng.randn(int(sr * seconds)) * 0.02
+    pitches = []
+
+    position = int(0.05 * sr)
+    while position < len(y) - int(0.1 * sr):
+        length = min(int(rng.uniform(0.1, 0.35) * sr), len(y) - position)
+        t = np.arange(length) / float(length)
+
+        f0 = rng.uniform(350, 1200) * (1 + 0.03 * np.sin(2 * np.pi * t))
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        envelope = np.sin(np.pi * t) ** 2 * rng.uniform(0.3, 1.0)
+
+        y[position:position + length] += envelope * (np.sin(phase) + 0.5 * np.sin(2 * phase) + 0.25 * np.sin(3 * phase))
+        pitches.append(f0[envelope > 0.5 * envelope.max()])
+
+        position += length + int(rng.uniform(0.15, 0.6) * sr)
+
+    y = (y / np.max(np.abs(y)) * 0.8).astype(np.float32)
+
+    return y, float(np.median(np.concatenate(pitches)))
+
+'''------------------------------------
+PITCH COMPARISON:
+    receives the amount of synthetic splits and the sample rate,
+    prints how far the pitch of the whole-split fft and of the frames are from the pitch of the barks,
+    and the time both take on long splits
+------------------------------------'''
+def compare_pitch(count=200, sr=22050):
+    import time
+
+    errors = { 'spectrum' : [], 'frames' : [] }
+    for seed in range(count):
+        y, expected = pitched_barks(seed, sr, np.random.RandomState(seed).uniform(0.4, 4.0))
+        signal = SignalAnalysis(audio.to_pcm(y), sr)
+
+        errors['spectrum'].append(abs(signal.pitch_roughness()[0] - expected) / expected)
+        errors['frames'].append(abs(signal.frame_pitch() - expected) / expected)
+
+    print(count, "synthetic splits")
+    for method in ('spectrum', 'frames'):
+        error = np.array(errors[method])
+        print("%-9s median error %.2f%%, mean error %.2f%%, %.0f%% within 3%%"
+            % (method, 100 * np.median(error), 100 * np.mean(error), 100 * np.mean(error < 0.03)))
+
+    for seconds in (5, 30, 60):
+        pcm = audio.to_pcm(pitched_barks(0, sr, seconds)[0])
+
+        start = time.time()
+        SignalAnalysis(pcm, sr).pitch_roughness()
+        whole = time.time() - start
+
+        start = time.time()
+        SignalAnalysis(pcm, sr).frame_pitch()
+        frames = time.time() - start
+
+        print("%d s: whole-split fft %.3f s, frames %.3f s" % (seconds, whole, frames))
+
+
+'''------------------------------------
+STREAMED FRAMES CHECK:
+    receives a random seed,
+    returns if the frames given by FrameStream (fed in blocks of random sizes) have the same
+    centroids as SignalAnalysis on series of lengths around the padding and frame lengths
+------------------------------------'''
+def check_streamed_frames(seed=0, sr=22050):
+    rng = np.random.RandomState(seed)
+    ok = True
+
+    for length in (0, 1, 2, N_FFT // 2, N_FFT // 2 + 1, N_FFT - 1, N_FFT, N_FFT + 1, 5 * HOP_LENGTH + 3, 3 * sr + 17):
+        y = (rng.randn(length) * 0.2).astype(np.float32)
+        expected = SignalAnalysis(y, sr).centroid()
+
+        frames = FrameStream()
+        magnitudes = []
+        position = 0
+        while position < length:
+            size = rng.randint(1, 3 * N_FFT)
+            magnitudes.append(frames.update(y[position:position + size]))
+            position += size
+        magnitudes.append(frames.finish())
+
+        cent = frame_centroids(np.concatenate(magnitudes), frame_frequencies(sr))
+        if len(cent) != len(expected) or not np.array_equal(cent, expected):
+            print("streamed frames mismatch on a series of", length, "samples")
+            ok = False
+
+    return ok
+
+
+# checks the streamed frames against the whole-series ones, and compares the centroid
+# with librosa.feature.spectral_centroid on wav files (or the pitch estimates on synthetic barks)
+# usage: python analysis.py [wav files...]
+#        python analysis.py pitch
+if __name__ == '__main__':
+    if sys.argv[1:] == ['pitch']:
+        compare_pitch()
+        sys.exit()
+
+    ok = all(check_streamed_frames(seed) for seed in range(5))
+    if ok:
+        print("streamed frames match the whole-series frames")
+
+    import librosa
+    from scipy.io.wavfile import read
+
+    for sound_file in sys.argv[1:]:
+        fs, data = read(sound_file)
+        y = audio.to_float(data)
+
+        expected = librosa.feature.spectral_centroid(y=y, sr=fs, pad_mode='reflect')[0]
+        cent = SignalAnalysis(y, fs).centroid()
+
+        print(sound_file, "| frames:", len(cent), len(expected),
+            "| largest centroid difference: %.6f Hz" % np.max(np.abs(cent - expected)),
+            "| range:", SignalAnalysis(y, fs).centroid_range(), (expected.min(), expected.max()))
+
+    if not ok:
+        sys.exit(1)
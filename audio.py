@@ -0,0 +1,302 @@
+# used in the sample computations
+import numpy as np
+
+# used in resampling
+from scipy import signal
+from math import gcd
+import functools
+
+# used to obtain project constants
+import constants
+
+# amount of samples converted at a time when working on integer audio
+# (keeps the temporary float copies small)
+CHUNK_SIZE = 2**18
+
+'''------------------------------------
+SAMPLE FORMATS:
+    the type the samples have at every stage (each stage hands its array to the next one
+    without copying it unless the type changes)
+
+    raw recordings      int16 at rest (as recorded), normalized in place (apply_gain)
+    preprocessing       mono float32 in [-1, 1) (to_float, resample, the noise reduction
+                        chain and the trimming all keep float32, the trim is a view)
+    splits              float32 wav at rest (written from views of the cleaned recording)
+    extraction          the float32 split is memory-mapped and turned into int32 pcm once (to_pcm),
+                        which is what pydub read before, so the features keep their values
+    reductions          sums, running sums and the fft of a split are done in float64
+                        (one array per split, see analysis.py), every other temporary copy
+                        is at most CHUNK_SIZE samples
+
+    the memory of these stages is measured by benchmark.py
+
+    the splits are not kept as int16: rounding them to 16 bits would change every feature
+------------------------------------'''
+
+'''------------------------------------
+FULL SCALE OBTAINER:
+    receives an audio array,
+    returns the largest possible amplitude for its sample type (like pydub's max_possible_amplitude)
+------------------------------------'''
+def full_scale(data):
+    if np.issubdtype(data.dtype, np.floating):
+        return 1.0
+    return float(2 ** (8 * data.dtype.itemsize - 1))
+
+# 8-bit wav files are unsigned, centered on 128
+# (returns the samples as float64 centered on 0, written into out when it is given)
+def centered(chunk, out=None):
+    if out is None:
+        out = np.empty(chunk.shape, dtype=np.float64)
+    out[...] = chunk
+    if chunk.dtype == np.uint8:
+        out -= 128
+    return out
+
+# samples that can be compared with a level (8-bit audio centered, the rest as it is, without a copy)
+def signed(data):
+    if data.dtype == np.uint8:
+        return centered(data)
+    return data
+
+'''------------------------------------
+LOUDNESS OBTAINER:
+    receives an audio array (int16, int32, uint8 or float, any amount of channels),
+    returns its loudness in dBFS (same value as pydub's AudioSegment.dBFS for integer audio)
+------------------------------------'''
+def dbfs(data):
+    flat = data.reshape(-1)
+    if len(flat) == 0:
+        return -float('inf')
+
+    sum_of_squares = 0.0
+    for i in range(0, len(flat), CHUNK_SIZE):
+        chunk = centered(flat[i:i + CHUNK_SIZE])
+        sum_of_squares += float(np.dot(chunk, chunk))
+
+    rms = np.sqrt(sum_of_squares / len(flat))
+
+    # audioop.rms gives a whole number for integer samples
+    if not np.issubdtype(data.dtype, np.floating):
+        rms = np.floor(rms)
+
+    if rms == 0:
+        return -float('inf')
+
+    return 20 * np.log10(rms / full_scale(data))
+
+'''------------------------------------
+GAIN APPLIER:
+    receives an audio array and the gain (in dB),
+    applies the gain in place and returns the same array
+    (float audio is kept within [-1, 1], integer audio is clipped and rounded down like audioop.mul)
+------------------------------------'''
+def apply_gain(data, gain):
+    multiplier = 10.0 ** (gain / 20.0)
+
+    if np.issubdtype(data.dtype, np.floating):
+        np.multiply(data, multiplier, out=data, casting='same_kind')
+        np.clip(data, -1.0, 1.0, out=data)
+        return data
+
+    flat = data.reshape(-1)
+    info = np.iinfo(data.dtype)
+    offset = 128 if data.dtype == np.uint8 else 0
+
+    for i in range(0, len(flat), CHUNK_SIZE):
+        chunk = centered(flat[i:i + CHUNK_SIZE])
+        chunk *= multiplier
+        np.floor(chunk, out=chunk)
+        chunk += offset
+        np.clip(chunk, info.min, info.max, out=chunk)
+        flat[i:i + CHUNK_SIZE] = chunk
+
+    return data
+
+'''------------------------------------
+NORMALIZATION:
+    receives an audio array and the target loudness (in dBFS, optional),
+    applies the gain that brings the audio to the target loudness in place,
+    returns the same array
+------------------------------------'''
+def normalize(data, target_dbfs=None):
+    if target_dbfs is None:
+        target_dbfs = constants.TARGET_DBFS
+
+    loudness = dbfs(data)
+
+    # digital silence stays as it is
+    if not np.isfinite(loudness):
+        return data
+
+    return apply_gain(data, target_dbfs - loudness)
+
+'''------------------------------------
+TIME SERIES CONVERTER:
+    receives an audio array (frames or frames x channels),
+    returns a mono float32 time series scaled to [-1, 1) (like librosa.load, without resampling)
+------------------------------------'''
+def to_float(data):
+    if data.ndim > 1:
+        y = data.mean(axis=1, dtype=np.float32)
+    else:
+        y = data.astype(np.float32)
+
+    if data.dtype == np.uint8:
+        y -= 128
+
+    if not np.issubdtype(data.dtype, np.floating):
+        y /= full_scale(data)
+
+    return y
+
+'''------------------------------------
+PCM CONVERTER:
+    receives an audio array,
+    returns float audio as 32-bit pcm (rounded and clipped like ffmpeg's pcm_s32le,
+    which is what pydub reads a float wav as), integer audio as it is
+------------------------------------'''
+def to_pcm(data):
+    if not np.issubdtype(data.dtype, np.floating):
+        return data
+
+    pcm = np.empty(data.shape, dtype=np.int32)
+    flat = data.reshape(-1)
+    flat_pcm = pcm.reshape(-1)
+
+    # a chunk at a time, so the float64 copy stays small
+    for i in range(0, len(flat), CHUNK_SIZE):
+        chunk = np.rint(flat[i:i + CHUNK_SIZE].astype(np.float64) * 2**31)
+        np.clip(chunk, -2**31, 2**31 - 1, out=chunk)
+        flat_pcm[i:i + CHUNK_SIZE] = chunk
+
+    return pcm
+
+'''------------------------------------
+WORKING SAMPLE RATE:
+    receives the sample rate of a recording,
+    returns the sample rate every stage will work at
+    (the same rate if it is in NATIVE_SAMPLE_RATES, SAMPLE_RATE otherwise)
+------------------------------------'''
+def working_rate(fs):
+    if fs in constants.NATIVE_SAMPLE_RATES:
+        return fs
+    return constants.SAMPLE_RATE
+
+'''------------------------------------
+RESAMPLING FILTER:
+    receives the source and target sample rates,
+    returns the upsampling and downsampling factors and the lowpass filter taps
+    (the filter resample_poly would design, made once per pair of rates)
+------------------------------------'''
+@functools.lru_cache(maxsize=None)
+def resampling_filter(orig_sr, target_sr):
+    g = gcd(int(orig_sr), int(target_sr))
+    up = int(target_sr) // g
+    down = int(orig_sr) // g
+
+    max_rate = max(up, down)
+    taps = signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    taps.flags.writeable = False
+
+    return up, down, taps
+
+'''------------------------------------
+RESAMPLER:
+    receives audio time series (y), its sample rate and the target sample rate,
+    returns the time series at the target sample rate (polyphase filtering)
+------------------------------------'''
+def resample(y, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return y
+
+    up, down, taps = resampling_filter(orig_sr, target_sr)
+
+    return signal.resample_poly(y, up, down, window=taps).astype(np.float32)
+
+'''------------------------------------
+WORKING RATE CONVERTER:
+    receives audio time series (y) and its sample rate (fs),
+    returns the time series and sample rate every stage will work at
+------------------------------------'''
+def at_working_rate(y, fs):
+    sr = working_rate(fs)
+
+    return resample(y, fs, sr), sr
+
+'''------------------------------------
+BLOCK RESAMPLER:
+    the resampler with the filter state carried across blocks
+    (gives the same samples as resample() on the whole time series)
+    process() receives the next block, returns the resampled samples that are ready
+    finish() returns the rest once there is no more audio
+    delay is the largest amount of output samples held back behind the input received
+------------------------------------'''
+class Resampler:
+    def __init__(self, orig_sr, target_sr):
+        self.up = self.down = 1
+        self.delay = 0
+
+        # nothing to do when the rates are the same
+        if orig_sr == target_sr:
+            return
+
+        up, down, taps = resampling_filter(orig_sr, target_sr)
+        self.up = up
+        self.down = down
+
+        # same padding as resample_poly so both give the same samples
+        half_len = (len(taps) - 1) // 2
+        pre_pad = down - half_len % down
+        self.h = np.concatenate([np.zeros(pre_pad), taps * up])
+        self.pre_remove = (half_len + pre_pad) // down
+        self.delay = self.pre_remove
+
+        # input samples that are still needed (buffer_start is kept a multiple of down)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0
+        self.received = 0
+
+        # next output index (counted with the removed pre_remove samples)
+        self.next = self.pre_remove
+
+    def outputs(self, last):
+        # outputs self.next up to last (inclusive) from the buffered input
+        if last < self.next:
+            return np.zeros(0, dtype=np.float32)
+
+        y = signal.upfirdn(self.h, self.buffer, self.up, self.down)
+        offset = self.buffer_start * self.up // self.down
+        first = self.next - offset
+        if len(y) < last - offset + 1:
+            y = np.concatenate([y, np.zeros(last - offset + 1 - len(y))])
+
+        self.next = last + 1
+
+        return y[first:last - offset + 1].astype(np.float32)
+
+    def process(self, block):
+        if self.up == self.down:
+            return block
+
+        self.buffer = np.concatenate([self.buffer, block])
+        self.received += len(block)
+
+        # outputs whose input samples have all been received
+        out = self.outputs((self.received * self.up - 1) // self.down)
+
+        # drops the input samples that no later output needs
+        keep_from = ((self.next * self.down - len(self.h)) // self.up + 1) // self.down * self.down
+        keep_from = min(max(keep_from, self.buffer_start), self.received)
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+
+        return out
+
+    def finish(self):
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+
+        total = -(-self.received * self.up // self.down)
+
+        return self.outputs(self.pre_remove + total - 1)
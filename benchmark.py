@@ -0,0 +1,262 @@
+# used in timing and memory profiling
+import time
+import tracemalloc
+
+# used in keeping the output of the measured functions out of the report
+import contextlib
+import io
+
+# used in the temporary folder doTheSplit writes its splits to
+import os
+import tempfile
+
+# used in the environment of the results
+import platform
+
+# used in obtaining arguments
+import sys
+
+import numpy as np
+import scipy
+
+# writing the synthetic recordings (for doTheSplit)
+from scipy.io.wavfile import write
+
+# used to obtain project constants
+import constants
+
+# the measured functions
+import preprocess
+import features
+import segmenter
+
+# used in turning the synthetic recording into what extract.py works on
+import audio
+
+# used in generating the synthetic barks
+import analysis
+
+# used in measuring the split reader without a manifest (the pydub fallback)
+import manifest
+
+# used in saving and reading the baseline
+import cache
+
+# results other runs are compared against
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# a function is slower (or uses more memory) than the baseline when it goes over this ratio
+TOLERANCE = 1.25
+# differences under these are noise, whatever the ratio
+MIN_SECONDS_DIFFERENCE = 0.002
+MIN_MB_DIFFERENCE = 1.0
+
+# what is measured when no arguments are given
+SECONDS = [5.0, 30.0]
+RATES = [22050]
+REPEAT = 5
+SEED = 0
+
+'''------------------------------------
+SYNTHETIC RECORDING:
+    receives a random seed, sample rate and duration (in seconds),
+    returns the same noisy time series of harmonic barks (float32) for the same arguments
+    (see analysis.pitched_barks)
+------------------------------------'''
+def synthetic_recording(seed=SEED, sr=22050, seconds=5.0):
+    return analysis.pitched_barks(seed, sr, seconds)[0]
+
+'''------------------------------------
+MEASURER:
+    receives a function, its arguments and the amount of timed runs,
+    returns the median and best time (seconds) of the runs and the peak memory allocated (MB)
+    in one more run (under tracemalloc, which slows the function down, so it is not timed),
+    or the error when the function fails
+------------------------------------'''
+def measure(function, args, repeat=REPEAT):
+    times = []
+
+    try:
+        # whatever the function prints is not part of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(repeat):
+                start = time.perf_counter()
+                function(*args)
+                times.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            try:
+                function(*args)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return { 'error' : type(e).__name__ + ': ' + str(e) }
+
+    return {
+        'seconds' : float(np.median(times)),
+        'best' : float(np.min(times)),
+        'peak_mb' : peak / 1e6
+    }
+
+'''------------------------------------
+BENCHMARKS:
+    receives a synthetic recording and its sample rate,
+    returns the name, function and arguments of every hot path
+    (the split functions get the recording the way extract.py reads a split, as 32-bit pcm)
+    and of every stage that hands the samples to the next one (see SAMPLE FORMATS in audio.py)
+------------------------------------'''
+def benchmarks(y, sr):
+    # the recording doTheSplit reads, in the working folder (like the files in toBeSplit)
+    sound_file = 'recording.wav'
+    write(sound_file, sr, y)
+
+    pcm = audio.to_pcm(y)
+    fftData, w = features.doFFT(pcm, sr)
+
+    # a split listed without a manifest (read with pydub, as 32-bit pcm)
+    split_file = 'split-recording-0.wav'
+    write(split_file, sr, pcm)
+
+    def split_on_silence(data, fs):
+        return segmenter.chunk_lengths(data, fs, constants.MIN_SILENCE_LEN,
+            constants.SILENCE_THRESH, constants.KEEP_SILENCE)
+
+    return [
+        ('doTheSplit', preprocess.doTheSplit, (sound_file,)),
+        ('reduce_noise_centroid_mb', preprocess.reduce_noise_centroid_mb, (y, sr)),
+        ('trim_silence', preprocess.trim_silence, (y,)),
+        ('doFFT', features.doFFT, (pcm, sr)),
+        ('get_IBI', features.get_IBI, (pcm, sr)),
+        ('get_roughness', features.get_roughness, (fftData, np.max(fftData))),
+        ('split_on_silence', split_on_silence, (pcm, sr)),
+        ('to_pcm', audio.to_pcm, (y,)),
+        # a new analysis every run, so nothing is taken from its cache
+        ('energy', lambda data: analysis.SignalAnalysis(data, sr).energy(), (pcm,)),
+        ('stft', lambda data: analysis.SignalAnalysis(data, sr).stft(), (y,)),
+        ('read_split (pydub)', manifest.read_split, ({ 'filename' : split_file }, '.')),
+    ]
+
+'''------------------------------------
+BENCHMARK RUNNER:
+    receives the durations (seconds) and sample rates of the synthetic recordings and the amount of timed runs,
+    returns the results of every benchmark (by '<function> <sr> Hz <seconds> s')
+    with the settings and environment they were measured with
+------------------------------------'''
+def run(seconds_list=SECONDS, rates=RATES, repeat=REPEAT):
+    results = {}
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as folder:
+        # doTheSplit writes to 'data' in the working folder
+        os.chdir(folder)
+        try:
+            for sr in rates:
+                for seconds in seconds_list:
+                    y = synthetic_recording(SEED, sr, seconds)
+                    for name, function, args in benchmarks(y, sr):
+                        key = "%s %d Hz %g s" % (name, sr, seconds)
+                        results[key] = measure(function, args, repeat)
+                        print_result(key, results[key])
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'settings' : {
+            'seed' : SEED,
+            'repeat' : repeat,
+            'NOISE_REDUCTION_BACKEND' : constants.NOISE_REDUCTION_BACKEND,
+            'FFT_PADDING' : constants.FFT_PADDING
+        },
+        'environment' : {
+            'python' : platform.python_version(),
+            'numpy' : np.__version__,
+            'scipy' : scipy.__version__,
+            'platform' : platform.platform(),
+            'processor' : platform.processor()
+        },
+        'results' : results
+    }
+
+def print_result(key, result):
+    if 'error' in result:
+        print("%-45s failed (%s)" % (key, result['error']))
+    else:
+        print("%-45s %9.4f s (best %.4f s) %9.1f MB" % (key, result['seconds'], result['best'], result['peak_mb']))
+
+'''------------------------------------
+BASELINE COMPARISON:
+    receives the results of a run and of the baseline,
+    prints the ratio of the time and memory of every benchmark in both,
+    returns the benchmarks that went over TOLERANCE
+------------------------------------'''
+def compare(run_results, baseline):
+    regressions = []
+
+    if baseline.get('settings') != run_results['settings']:
+        print("the baseline was measured with other settings:", baseline.get('settings'))
+
+    print("%-45s %12s %12s" % ("benchmark", "time ratio", "memory ratio"))
+
+    for key, result in run_results['results'].items():
+        before = baseline.get('results', {}).get(key)
+        if before is None or 'error' in before or 'error' in result:
+            continue
+
+        time_ratio = result['seconds'] / max(before['seconds'], 1e-9)
+        memory_ratio = result['peak_mb'] / max(before['peak_mb'], 1e-9)
+
+        slower = time_ratio > TOLERANCE and result['seconds'] - before['seconds'] > MIN_SECONDS_DIFFERENCE
+        bigger = memory_ratio > TOLERANCE and result['peak_mb'] - before['peak_mb'] > MIN_MB_DIFFERENCE
+
+        flag = ""
+        if slower or bigger:
+            regressions.append(key)
+            flag = "  <-- regression"
+
+        print("%-45s %12.2f %12.2f%s" % (key, time_ratio, memory_ratio, flag))
+
+    return regressions
+
+def list_argument(args, name, default, kind):
+    if args.count(name):
+        return [kind(value) for value in args[args.index(name) + 1].split(',')]
+    return default
+
+
+# times and memory-profiles the hot paths on synthetic recordings
+# usage: python benchmark.py [--seconds 5,30] [--rates 22050] [--repeat 5] [save] [compare]
+#   save      writes the results as the baseline (benchmark_baseline.json)
+#   compare   compares the results with the baseline (exits with 1 if something got slower or bigger)
+# the code of an older commit is measured by running this file with 'save' in a checkout of it
+# (one with analysis.pitched_barks), then with 'compare' here
+if __name__ == '__main__':
+    args = list(sys.argv)
+
+    try:
+        seconds_list = list_argument(args, "--seconds", SECONDS, float)
+        rates = list_argument(args, "--rates", RATES, int)
+        repeat = list_argument(args, "--repeat", [REPEAT], int)[0]
+    except Exception as e:
+        print("Please include comma-separated numbers after --seconds, --rates and --repeat")
+        sys.exit()
+
+    run_results = run(seconds_list, rates, repeat)
+
+    regressions = []
+    if args.count("compare"):
+        baseline = cache.load_index(BASELINE_FILE)
+        if not baseline:
+            print("no baseline in", BASELINE_FILE, "(make one with 'save')")
+        else:
+            regressions = compare(run_results, baseline)
+
+    if args.count("save"):
+        cache.save_index(BASELINE_FILE, run_results)
+        print("baseline saved as ", BASELINE_FILE)
+
+    if regressions:
+        print(len(regressions), "benchmark(s) over the baseline:")
+        for key in regressions:
+            print("   ", key)
+        sys.exit(1)
@@ -0,0 +1,61 @@
+# used in hashing the files and settings
+import hashlib
+
+# used in saving the cache index
+import json
+import os
+
+# amount of bytes read at a time when hashing a file
+READ_SIZE = 2**20
+
+'''------------------------------------
+FILE HASHER:
+    receives filename,
+    returns the sha256 of the file contents (as hex)
+------------------------------------'''
+def file_hash(file_name):
+    sha = hashlib.sha256()
+
+    with open(file_name, 'rb') as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+'''------------------------------------
+SETTINGS HASHER:
+    receives a dictionary of settings (json-friendly values),
+    returns the sha256 of the settings (as hex), independent of the order of the keys
+------------------------------------'''
+def settings_hash(settings):
+    text = json.dumps(settings, sort_keys=True)
+
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+'''------------------------------------
+INDEX READER:
+    receives the path of the index file,
+    returns the index as a dictionary (empty if there is no index yet or it cannot be read)
+------------------------------------'''
+def load_index(index_file):
+    try:
+        with open(index_file) as f:
+            return json.load(f)
+    except Exception as e:
+        return {}
+
+'''------------------------------------
+INDEX WRITER:
+    receives the path of the index file and the index,
+    writes the index (through a temporary file, so an interrupted run never leaves half an index)
+------------------------------------'''
+def save_index(index_file, index):
+    temp_file = index_file + '.tmp'
+
+    with open(temp_file, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+
+    os.replace(temp_file, index_file)
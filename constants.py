@@ -11,23 +11,69 @@ CONSTANTS FOR SPLITTING
 MIN_VAL_FOR_SPLITTING =  0.150
 MIN_VAL = 100000000
 
+# full scale MIN_VAL is measured against (32-bit pcm), [interbark interval]
+# other sample widths and float audio are scaled to it so the threshold means the same level
+MIN_VAL_FULL_SCALE = 2**31
+
 # amount of time to skip after detecting a bark (in seconds)
 SECONDS = 0.25
 
 # seconds until program will record for another bark sequence
 SECONDS_UNTIL_NEXT_BARK_SEQUENCE = .5
 
+'''------------------------------------
+CONSTANTS FOR LOADING
+------------------------------------'''
+# sample rate (in Hz) the recordings are resampled to
+SAMPLE_RATE = 22050
+
+# recordings that already have one of these sample rates are kept as they are
+NATIVE_SAMPLE_RATES = [22050]
+
 '''------------------------------------
 CONSTANTS FOR NORMALIZATION
 ------------------------------------'''
 TARGET_DBFS = -17.5
 
+'''------------------------------------
+CONSTANTS FOR NOISE REDUCTION
+------------------------------------'''
+# engine that applies the lowshelf/highshelf/limiter chain
+# 'sox' (through pysndfx, needs sox installed) or 'scipy' (in-process IIR filters)
+# ('scipy' models the sox chain, it is not yet measured against sox, see filters.TOLERANCE)
+NOISE_REDUCTION_BACKEND = 'sox'
+
 '''------------------------------------
 CONSTANTS FOR FEATURE EXTRACTION
 ------------------------------------'''
 # in decimal format [roughness formula]
 PERCENT_OF_MAX = .5
 
+# zero-padding of the fft [pitch and roughness]
+# 'pow2' pads to the next power of 2 (same bins, so same pitch and roughness as the old doFFT),
+# 'fast' to the next fast length (shorter, but the bins move, and roughness with them)
+FFT_PADDING = 'pow2'
+
+# silence detection for the bark length [bark length]
+# length (ms) of silence that separates two barks
+MIN_SILENCE_LEN = 100
+# threshold (dBFS) under which a window is silent
+SILENCE_THRESH = -35
+# silence (ms) kept at both ends of a bark
+KEEP_SILENCE = 50
+
+# pitch estimate [pitch]
+# 'spectrum' is the frequency with the highest amplitude in the fft of the whole split (as before),
+# 'frames' the median of the highest peak of every short frame (interpolated between the bins),
+# over the frames that are at most PITCH_TOP_DB under the loudest one (see analysis.py)
+PITCH_METHOD = 'spectrum'
+PITCH_TOP_DB = 20
+
+# modules with custom features, imported by features.py (each one calls features.register_feature)
+# (their values must be numbers, the store keeps them as float64)
+# example: FEATURE_PLUGINS = ['my_features']
+FEATURE_PLUGINS = []
+
 '''------------------------------------
 CONSTANTS FOR SVM PORTION
 ------------------------------------'''
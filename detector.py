@@ -0,0 +1,425 @@
+# used in the ring buffer and sample conversions
+import numpy as np
+
+# used in measuring the processing time and pacing the file source
+import time
+
+# used in finding the bark sequences across chunks
+import segmenter
+
+# used in converting, normalizing and resampling the pcm frames
+import audio
+
+# used in the noise reduction of the frames
+import filters
+
+# used in calibrating the noise reduction (spectral centroid)
+import analysis
+
+# used to obtain project constants
+import constants
+
+# used in reading the file-backed frame source
+import stream
+
+# used in obtaining arguments
+import sys
+
+# seconds of audio kept in the ring buffer
+BUFFER_SECONDS = 30.0
+
+# seconds of audio the detector calibrates on when it is not given a calibration
+CALIBRATION_SECONDS = 5.0
+
+'''------------------------------------
+RING BUFFER:
+    keeps the latest samples of a stream in a fixed-size array
+    write() receives the next samples
+    read() receives absolute (start, end) sample indices,
+    returns the samples (None if they are no longer in the buffer)
+------------------------------------'''
+class RingBuffer:
+    def __init__(self, size):
+        self.data = np.zeros(size, dtype=np.float32)
+        self.size = size
+
+        # amount of samples written so far
+        self.position = 0
+
+    def write(self, samples):
+        # only the newest samples fit
+        if len(samples) > self.size:
+            self.position += len(samples) - self.size
+            samples = samples[-self.size:]
+
+        idx = self.position % self.size
+        first = min(len(samples), self.size - idx)
+        self.data[idx:idx + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+        self.position += len(samples)
+
+    def read(self, start, end):
+        if start < self.position - self.size or end > self.position or start > end:
+            return None
+
+        idx = np.arange(start, end) % self.size
+        return self.data[idx]
+
+'''------------------------------------
+BARK EVENT:
+    kind ('start' when a bark sequence begins, 'end' when it is closed),
+    start and end timestamps (in seconds from the first frame, end is None for 'start'),
+    peak (timestamp of the first peak, for 'start'),
+    latency (seconds of audio received after the moment the event describes),
+    audio of the sequence (for 'end', the cleaned audio at the working sample rate,
+    None if it no longer fits in the ring buffer)
+------------------------------------'''
+class BarkEvent:
+    def __init__(self, kind, start, end, peak, latency, audio=None):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.peak = peak
+        self.latency = latency
+        self.audio = audio
+
+    def __repr__(self):
+        return 'BarkEvent(' + self.kind + ', start=' + str(self.start) + ', end=' + str(self.end) + \
+            ', latency=' + str(self.latency) + ')'
+
+'''------------------------------------
+CALIBRATION:
+    receives mono float frames and their sample rate (fs),
+    returns the normalization gain (dB) and the lowest and highest spectral centroid of the
+    normalized frames at the working sample rate (what stream.analyze measures on a whole recording)
+------------------------------------'''
+def calibration(frames, fs):
+    gain = constants.TARGET_DBFS - audio.dbfs(frames)
+    if not np.isfinite(gain):
+        gain = 0.0
+
+    y = audio.resample(audio.apply_gain(frames.astype(np.float32), gain), fs, audio.working_rate(fs))
+    threshold_l, threshold_h = analysis.SignalAnalysis(y, audio.working_rate(fs)).centroid_range()
+
+    return gain, threshold_l, threshold_h
+
+'''------------------------------------
+BARK DETECTOR:
+    live version of the splitting in preprocess.py
+    (same MIN_VAL_FOR_SPLITTING, SECONDS and SECONDS_UNTIL_NEXT_BARK_SEQUENCE semantics)
+    receives the sample rate (fs), the seconds of audio to keep and the calibration
+    (the gain and centroid range from stream.analyze or calibration(), optional),
+    feed() receives pcm frames of any size (int or float, mono),
+    returns the bark events found in them
+    finish() returns the events of the audio still held back and the 'end' event of a sequence
+    still open when the audio stops
+
+    MIN_VAL_FOR_SPLITTING is set for the cleaned audio the batch splitter sees, so the frames go
+    through the same chain as in stream.py before they are searched: normalization gain,
+    resampling to the working sample rate and the noise reduction (scipy chain)
+    without a calibration, the first CALIBRATION_SECONDS of audio are held back and calibrated on
+    (the silence trimming of the batch path is not done, a live stream has no end to trim against)
+
+    a 'start' event is given as soon as the first peak of a sequence arrives,
+    an 'end' event as soon as SECONDS_UNTIL_NEXT_BARK_SEQUENCE of dead air has passed
+    (see latency_bound)
+------------------------------------'''
+class BarkDetector:
+    def __init__(self, fs, buffer_seconds=BUFFER_SECONDS, calibration=None):
+        self.fs = fs
+        self.sr = audio.working_rate(fs)
+        self.tracker = segmenter.SequenceTracker(self.sr)
+        self.buffer = RingBuffer(int(buffer_seconds * self.sr))
+
+        # amount of frames received so far (at fs)
+        self.received = 0
+
+        # frames held back until the detector is calibrated
+        self.pending = []
+        self.calibrated = calibration is not None
+        self.chain = None
+        if calibration is not None:
+            self.calibrate(*calibration)
+
+        # if a bark sequence is open (its 'start' event was already given) and its first peak
+        self.open = False
+        self.first_peak = None
+
+        # largest latency given so far (seconds of audio) and largest time spent in feed() (seconds)
+        self.max_latency = 0.0
+        self.max_processing_time = 0.0
+
+    def calibrate(self, gain, threshold_l, threshold_h):
+        self.calibration = (gain, threshold_l, threshold_h)
+        self.gain = gain
+        self.resampler = audio.Resampler(self.fs, self.sr)
+        self.chain = filters.NoiseReductionChain(threshold_l, threshold_h)
+
+    '''------------------------------------
+    LATENCY BOUND:
+        receives the largest amount of frames fed in one call,
+        returns the largest latency an event can have (in seconds): the frames of one call,
+        the samples the resampler holds back and the calibration window (when it is not given)
+
+        this is the delay after the moment an event describes, an 'end' event is only known
+        once SECONDS_UNTIL_NEXT_BARK_SEQUENCE of dead air has passed after the last bark
+        (its end timestamp is that moment), that wait is part of the splitting and is not counted
+    ------------------------------------'''
+    def latency_bound(self, chunk_size):
+        bound = chunk_size / float(self.fs) + audio.Resampler(self.fs, self.sr).delay / float(self.sr)
+        if not self.calibrated:
+            bound += CALIBRATION_SECONDS
+        return bound
+
+    def event(self, kind, start, end, peak):
+        # the moment the event describes ('end' is known when the timeout passes)
+        moment = end if end is not None else peak
+        latency = self.received / float(self.fs) - moment / float(self.sr)
+        self.max_latency = max(self.max_latency, latency)
+
+        sequence = None
+        if end is not None:
+            sequence = self.buffer.read(start, end)
+            start_time = start / float(self.sr)
+            end_time = end / float(self.sr)
+        else:
+            start_time = start / float(self.sr)
+            end_time = None
+
+        return BarkEvent(kind, start_time, end_time, peak / float(self.sr), latency, sequence)
+
+    # normalization, resampling and noise reduction (last: also the samples the resampler holds back)
+    def clean(self, frames, last=False):
+        y = self.resampler.process(audio.apply_gain(frames.astype(np.float32), self.gain))
+        if last:
+            y = np.concatenate([y, self.resampler.finish()])
+        return self.chain.process(y)
+
+    def track(self, y):
+        self.buffer.write(y)
+        sequences, peaks = self.tracker.feed(y)
+
+        # puts the peaks and the closed sequences in the order they happened
+        happenings = [(peak, 1, peak, None) for peak in peaks]
+        happenings += [(end, 0, start, end) for start, end in sequences]
+        happenings.sort()
+
+        events = []
+        for i, (position, kind, start, end) in enumerate(happenings):
+            if kind == 1 and not self.open:
+                # the start of this sequence is known once it closes, or it is the tracker's current one
+                closing = [h for h in happenings[i + 1:] if h[1] == 0]
+                if closing:
+                    sequence_start = closing[0][2]
+                else:
+                    sequence_start = self.tracker.startidx
+                events.append(self.event('start', sequence_start, None, position))
+                self.open = True
+                self.first_peak = position
+            elif kind == 0:
+                events.append(self.event('end', start, end, self.first_peak))
+                self.open = False
+
+        return events
+
+    def feed(self, frames):
+        began = time.perf_counter()
+
+        frames = np.asarray(frames)
+        if not np.issubdtype(frames.dtype, np.floating):
+            frames = audio.to_float(frames)
+        self.received += len(frames)
+
+        if self.chain is None:
+            self.pending.append(frames)
+            if self.received < CALIBRATION_SECONDS * self.fs:
+                return []
+            frames = np.concatenate(self.pending)
+            self.pending = []
+            self.calibrate(*calibration(frames, self.fs))
+
+        events = self.track(self.clean(frames))
+
+        self.max_processing_time = max(self.max_processing_time, time.perf_counter() - began)
+
+        return events
+
+    def finish(self):
+        frames = np.zeros(0, dtype=np.float32)
+        if self.received == 0:
+            return []
+        if self.chain is None:
+            frames = np.concatenate(self.pending + [frames])
+            self.pending = []
+            self.calibrate(*calibration(frames, self.fs))
+
+        events = self.track(self.clean(frames, last=True))
+
+        for start, end in self.tracker.finish():
+            events.append(self.event('end', start, end, self.first_peak))
+        self.open = False
+        return events
+
+'''------------------------------------
+FILE FRAME SOURCE:
+    stands in for a microphone
+    receives filename, frames per chunk and if the chunks are paced in real time,
+    yields mono float32 chunks of the recording
+------------------------------------'''
+def file_frames(file_name, chunk_size=1024, realtime=False):
+    fs = stream.read_rate(file_name)
+
+    for block in stream.mono(stream.read_blocks(file_name, chunk_size)):
+        if realtime:
+            time.sleep(len(block) / float(fs))
+        yield block
+
+'''------------------------------------
+CLEANED SERIES:
+    receives mono float frames, their sample rate (fs) and a calibration (see calibration()),
+    returns the whole series cleaned the way the detector cleans it, at the working sample rate
+------------------------------------'''
+def cleaned_series(frames, fs, calibration):
+    gain, threshold_l, threshold_h = calibration
+    y = audio.resample(audio.apply_gain(frames.astype(np.float32), gain), fs, audio.working_rate(fs))
+    return filters.NoiseReductionChain(threshold_l, threshold_h).process_all(y)
+
+'''------------------------------------
+SPLITTER COMPARISON:
+    receives mono float frames, their sample rate, the calibration (None to let the detector
+    calibrate itself), a random seed and the largest amount of frames fed in one call,
+    feeds the frames to the detector in chunks of random sizes,
+    returns if its events have the same bounds (and audio) as segmenter.find_sequences on the
+    same cleaned series and if no event came later than latency_bound
+------------------------------------'''
+def check_against_splitter(frames, fs, calibration=None, seed=0, max_chunk=4096):
+    rng = np.random.RandomState(seed)
+
+    detector = BarkDetector(fs, calibration=calibration)
+    events = []
+    largest = 0
+    position = 0
+    while position < len(frames):
+        size = rng.randint(1, max_chunk + 1)
+        largest = max(largest, size)
+        events += detector.feed(frames[position:position + size])
+        position += size
+    events += detector.finish()
+
+    sr = detector.sr
+    y = cleaned_series(frames, fs, detector.calibration)
+    sequences, peaks = segmenter.find_sequences(y, sr)
+
+    # one 'start' and one 'end' event per sequence, in order
+    expected = []
+    for start, end in sequences:
+        first_peak = min(peak for peak in peaks if start <= peak < end)
+        expected.append(('start', start / float(sr), None, first_peak / float(sr)))
+        expected.append(('end', start / float(sr), end / float(sr), first_peak / float(sr)))
+    found = [(event.kind, event.start, event.end, event.peak) for event in events]
+
+    same_audio = all(np.array_equal(event.audio, y[int(round(event.start * sr)):int(round(event.end * sr))])
+        for event in events if event.kind == 'end')
+    in_bound = detector.max_latency <= detector.latency_bound(largest)
+
+    print(fs, "Hz |", "calibrated on the recording |" if calibration is not None else "self-calibrated |",
+        len(sequences), "sequences |", len(events), "events",
+        "| largest latency %.4f s (bound %.4f s)" % (detector.max_latency, detector.latency_bound(largest)))
+
+    return found == expected and same_audio and in_bound
+
+'''------------------------------------
+BATCH COMPARISON:
+    receives the path of a wav file,
+    returns if the detector (calibrated on the whole recording, see stream.analyze) finds the same
+    bark sequences as the batch splitter on the cleaned recording (preprocess.py, scipy backend,
+    before the silence trimming)
+------------------------------------'''
+def check_against_batch(file_name):
+    from scipy.io.wavfile import read
+    import preprocess
+
+    fs, data = read(file_name)
+    data = data.copy()
+    audio.normalize(data, constants.TARGET_DBFS)
+    y, sr = audio.at_working_rate(audio.to_float(data), fs)
+    sequences = segmenter.find_sequences(preprocess.reduce_noise_centroid_mb(y, sr, backend='scipy'), sr)[0]
+
+    gain, sr, threshold_l, threshold_h = stream.analyze(file_name)
+    detector = BarkDetector(fs, calibration=(gain, threshold_l, threshold_h))
+    events = []
+    for frames in file_frames(file_name):
+        events += detector.feed(frames)
+    events += detector.finish()
+
+    found = [(int(round(event.start * sr)), int(round(event.end * sr))) for event in events if event.kind == 'end']
+
+    print(file_name, "|", len(found), "sequences live,", len(sequences), "batch")
+
+    return found == sequences
+
+
+# runs the detector on a recording as if it was live,
+# or compares it with the splitter on synthetic recordings and on barks5.wav (exits with 1 if they do not agree)
+# usage: python detector.py <wav file> [frames per chunk]
+#        python detector.py
+if __name__ == '__main__':
+    import os
+
+    if len(sys.argv) < 2:
+        ok = True
+        for seed in range(3):
+            for fs in (22050, 44100):
+                # barks after half a second of silence
+                y = np.concatenate([np.zeros(fs // 2, np.float32), analysis.pitched_barks(seed, fs, 8.0)[0] * 0.3])
+                for calibration_used in (calibration(y, fs), None):
+                    if not check_against_splitter(y, fs, calibration_used, seed):
+                        print("mismatch with the splitter on synthetic recording", seed, fs)
+                        ok = False
+
+        # the recording in the repository (forwards and reversed) between 25 seconds of silence,
+        # like a long raw recording with a few barks (on its own it is too short and loud to have
+        # any peak over the splitting threshold once it is cleaned)
+        recording = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'barks5.wav')
+        if os.path.exists(recording):
+            import tempfile
+            from scipy.io.wavfile import read, write
+
+            fs, data = read(recording)
+            silence = np.zeros(25 * fs, dtype=data.dtype)
+
+            with tempfile.TemporaryDirectory() as folder:
+                long_recording = os.path.join(folder, 'barks5-long.wav')
+                write(long_recording, fs, np.concatenate([silence, data, silence, data[::-1], silence]))
+
+                y = np.concatenate(list(file_frames(long_recording)))
+                gain, sr, threshold_l, threshold_h = stream.analyze(long_recording)
+                for seed in range(3):
+                    if not check_against_splitter(y, fs, (gain, threshold_l, threshold_h), seed, 1024):
+                        print("mismatch with the splitter on", recording)
+                        ok = False
+                if not check_against_batch(long_recording):
+                    print("mismatch with the batch splitter on", recording)
+                    ok = False
+
+        if not ok:
+            sys.exit(1)
+        print("the detector events match the splitter")
+        sys.exit()
+
+    file_name = sys.argv[1]
+    chunk_size = 1024
+    if len(sys.argv) > 2:
+        chunk_size = int(sys.argv[2])
+
+    fs = stream.read_rate(file_name)
+    detector = BarkDetector(fs)
+
+    for frames in file_frames(file_name, chunk_size):
+        for event in detector.feed(frames):
+            print(event)
+    for event in detector.finish():
+        print(event)
+
+    print("largest latency:", detector.max_latency, "seconds (bound:", detector.latency_bound(chunk_size), "seconds)")
+    print("largest processing time per chunk:", detector.max_processing_time, "seconds")
@@ -1,211 +1,21 @@
-# used in the fft data preparation
-import numpy as np
-
-# used in obtaining the dbfs and bark length
-import pydub
-
-# used in file enumeration
-import os
-
 # used in output of CSV
 import csv
-import constants
-
-# used in obtaining arguments
-import sys
-
-args = list(sys.argv)
 
-EXPERIMENT = False
+# used in computing the features of every set
+import features
 
-if len(args) > 1:
-    if args.count("exp"):
-        print("extracting for experiment")
-        EXPERIMENT = True
-    else:
-        EXPERIMENT = False
-else:
-    print("extracting for data collection")
-
-'''------------------------------------
-AVERAGE LOUDNESS OBTAINER:
-    receives object ( the array that contains all sequences ),
-    returns mean loudness of the entire file ( object )
-------------------------------------'''
-def get_average_loudness( obj ):
-    meanLoudness = 0
+# used in finding the splits of every recording
+import manifest
 
-    # does a summation of the loudness for each sequence
-    for sequence in range(len(obj)):
-        currentSequence = obj[sequence]
-        meanLoudness += currentSequence['dbfs']
-        
-    # gets the average
-    return meanLoudness / len(obj)
-
-
-'''------------------------------------
-AVERAGE INTERBARK INTERVAL OBTAINER:
-    receives data stream and sample rate,
-    returns mean interbark interval
-------------------------------------'''
-def get_IBI(_data, fs):
-    # just reassigns the variable
-    data = _data
-    data_size = len(data)
-    # constant : size of indices to jump incase a bark is detected
-    FOCUS_SIZE = int(constants.SECONDS * fs)
-    
-    focuses = []
-    distances = []
-    idx = 0
-    
-    while idx < len(data):
-        # if a value in the data stream exceeds the preset minimum value
-        if (data[idx] > constants.MIN_VAL):
-
-            # gets the index in the middle of the detected index and focus size
-            mean_idx = idx + FOCUS_SIZE // 2
-
-            # appends that index into the focuses 
-            focuses.append(float(mean_idx) / data_size)
-
-            # calculates the distance between the latest and second latest focus indices
-            if len(focuses) > 1:
-                last_focus = focuses[-2]
-                actual_focus = focuses[-1]
-                distances.append(actual_focus - last_focus)
-
-            # skips FOCUS_SIZE indices ahead
-            idx += FOCUS_SIZE
-        else:
-            idx += 1
-    
-    mean = 0
-
-    print(focuses)
-    print(distances)
-    print(len(distances) + 1 , "barks detected")
-
-    # does a summation of all the distances
-    for val in distances:
-        mean += val
-    
-    # tries to get the average
-    # if there's only one bark detected, will set the mean as 0
-    try:
-        mean = mean/len(distances)
-    except ZeroDivisionError as e:
-        mean = 0
-
-    return mean
+# used in obtaining arguments
+import sys
 
-'''------------------------------------
-LOUDNESS EXTRACTOR:
-    receives frequency domain data and maximum detected frequency,
-    returns the "rougness" of the data
-------------------------------------'''
-def get_roughness(fftData, max):
-    # to contain the points above a percentage of max
-    filtered = []
-
-    # used as a link to obtain the frequencies
-    i = 0
-    
-    # value used for "filtering" the points in the freq. domain
-    threshold_percent_of_max = max * constants.PERCENT_OF_MAX
-    
-    # iterates through all the values in fftData
-    for value in fftData:
-        # a check if the value is higher than the preset percentage of max and that the value is not the max value
-        if (value > threshold_percent_of_max and value != max):
-            # adds the value and its corresponding frequency into the 'filtered' array
-            filtered.append({ 'value' : value , 'freq' : w[i] })
-        i += 1
-
-    # summation
-    sum = 0.0
-    for value in filtered:
-        sum += value['value']
-    
-    try:
-        # getting the mean roughness of the points
-        temp_roughness = sum / float(len(filtered))
-    
-        # getting the roughness
-        roughness = temp_roughness / max
-    except Exception as e:
-        roughness = 0
-    
-    return roughness
+# used in skipping the splits that are gone
+import os
 
-'''------------------------------------
-FOURIER TRANSFORM:
-    receives data stream and sample rate,
-    returns amplitudes (fourier_to_plot) and corresponding frequencies (w)
-------------------------------------'''
-def doFFT(data, sampleRate):
-    # transforming the data (in time domain) to frequency domain using 1DFFT
-    # audio data and sample rate
-    aud_data = data
-    aud_sr = sampleRate
-
-    # data length
-    len_data = len(aud_data)
-
-    # padding zeros into data "zero-pad out your data to a power of 2" for faster FFT
-    # https://stackoverflow.com/a/48015264
-    data = np.zeros(2**(int(np.ceil(np.log2(len_data)))))
-    data[0:len_data] = aud_data
-
-
-    """A vectorized, non-recursive version of the Cooley-Tukey FFT"""
-
-    data = np.asarray(data, dtype=float)
-    N = data.shape[0]
-
-    if np.log2(N) % 1 > 0:
-        raise ValueError("size of x must be a power of 2")
-
-    # N_min here is equivalent to the stopping condition above,
-    # and should be a power of 2
-    N_min = min(N, 32)
-    
-    # Perform an O[N^2] DFT on all length-N_min sub-problems at once
-    n = np.arange(N_min)
-    k = n[:, None]
-    M = np.exp(-2j * np.pi * n * k / N_min)
-    X = np.dot(M, data.reshape((N_min, -1)))
-
-    # build-up each level of the recursive calculation all at once
-    while X.shape[0] < N:
-        X_even = X[:, :X.shape[1] // 2]
-        X_odd = X[:, X.shape[1] //2:]
-        factor = np.exp(-1j * np.pi * np.arange(X.shape[0])
-                        / X.shape[0])[:, None]
-        X = np.vstack([X_even + factor * X_odd,
-                       X_even - factor * X_odd])
-    
-    
-    # doing fft into the data
-    fft_data = X.ravel()
-
-    # makes an array with values from parameter 1 to parameter 2 
-    # number of elements in array depends on parameter 3 
-    # -- to be used as "steps" for frequencies --
-    w = np.linspace(0, aud_sr, len(fft_data))
-
-    # "First half is the real component, second half is imaginary"
-    fourier_to_plot = fft_data[0:len(fft_data)//2]
-    w = w[0:len(fft_data)//2]
-
-    # transforms all values in fourier_to_plot to their absolute value
-    # so we can have the representation in amplitude spectrum
-    # https://docs.scipy.org/doc/numpy-1.15.0/reference/routines.fft.html#implementation-details
-    fourier_to_plot = np.abs(fourier_to_plot)
-
-    # returns the values (fourier_to_plot) of the corresponding frequencies (w)
-    return fourier_to_plot, w
+# used in keeping the values of the splits from one run to the next
+import store
+import cache
 
 # -----------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------
@@ -220,242 +30,167 @@ def doFFT(data, sampleRate):
  (AKA MAIN FUNCTION)
 ------------------------------------'''
 
-targetFolder = 'data'
-
-toBePreprocessed = []
-toBePreprocessed = os.listdir(targetFolder)
-
-samples = []
-sets = []
-
-# gets all wav files
-for s in toBePreprocessed:
-    container = s.split('.')[-1]
-    if container == 'wav':
-        samples.append(s)
-
-# print(samples)
-
-# gets the unique names of all wav files
-for s in samples:
-    name = s.split('-')[1]
-    if name not in sets:
-        sets.append(name)
-
-# print(sets)
+# the worker processes import this file, so everything runs only in the main process
+if __name__ == '__main__':
+    args = list(sys.argv)
 
-print("start of read")
+    EXPERIMENT = False
 
-# array to contain all sequences as data
-allData = []
-
-# set : the original name of the unsplit wav files
-# example:  split-barks-0.wav
-#           is a part of the 'barks' set    
-for s in sets:
-    i = 0
-    
-    # will contain the bark sequences and the respective info for those
-    dataForThisSet = []
-
-    while True:
-        try:
-            # reconstructing the filenames
-            filename = 'split-' + s + '-' + str(i) + '.wav'
-            filestr = targetFolder + '/' + filename
-
-            # making a pydub AudioSegment from the wav file pointed to by the filenames
-            sound = pydub.AudioSegment.from_wav(filestr)
-            print(">>> got " + filestr)
-
-            # parsing the data steam
-            data = sound.get_array_of_samples()
-            data = np.array(data)
-            data = data.reshape(sound.channels, -1, order='F')
-            
-            # getting the sample rate
-            sr = sound.frame_rate
-
-            # getting the loudness
-            dbfs = sound.dBFS
-
-            # makes a temporary object with the attributes set
-            obj = {
-                'filename' : filename,
-                'data' : data,
-                'sr' : sr,
-                'dbfs' : dbfs
-            }
-
-            # adds this sequence into the array
-            dataForThisSet.append(obj)
-
-            # iterate to the next bark sequence
-            i += 1
-
-        except Exception as e:
-            # when no more sequences in the set
-            print("end")
-            break
-    # adds the array with sequences information to the main array with the set name as the key
-    allData.append({ s : dataForThisSet})
-    
-# to contain all rows for the final csv file
-allForExport = []
-
-
-for recording in range(len(allData)):
-    # to contain all rows for the recording
-    rowsForRecording = []
-    
-    # set a variable to have the reference to the object
-    current = allData[recording]
-    key = list(current.keys())[0]
-
-    if not EXPERIMENT:
-        # getting the classification for the entire set
-        # (assumes that one set is of only one classification aggressive/non-aggressive)
-        print("-------------------------------------")
-        print("Processing **" + str(key) + "** recording")
-
-        s = str(key)
-        classif = s.split('_')[0]
-        if classif == 'aggr':
-            classif = 1
+    if len(args) > 1:
+        if args.count("exp"):
+            print("extracting for experiment")
+            EXPERIMENT = True
         else:
-            classif = 0
-    print("-------------------------------------")
+            EXPERIMENT = False
+    else:
+        print("extracting for data collection")
 
-    # getting the average loudness (for perceptual spread)
-    meanLoudness = get_average_loudness(current[key])
-    print(meanLoudness)
+    # computes the spectra of all splits of a set together (in length buckets) instead of one by one
+    BATCHED = False
 
-    # the part where rows are filled in
-    for sequence in range(len(current[key])):
-        # make a temporary row
-        tempRow = {}
-        
-        # make a temporary variable to handle the sequence data
-        currentSequence = current[key][sequence]
-        
-        data = currentSequence['data'][0]
-        dataLength = len(data)
-        sampleRate = currentSequence['sr']
+    if args.count("batch"):
+        print("computing the spectra in batches")
+        BATCHED = True
 
-        # name is the file name
-        tempRow['name'] = currentSequence['filename']   
-        print("---S T A R T for", currentSequence['filename'])
-        
-        # calculating perceptual spread
-        diffInLoudness = meanLoudness - currentSequence['dbfs']
-        tempRow['perceptual_spread'] = diffInLoudness
-
-        # calculating bark length
-        # initializing a pydub AudioSegment using the array
-        audio = pydub.AudioSegment(
-            data=data.tobytes(),
-            sample_width=4,
-            frame_rate=sampleRate,
-            channels=1
-        )
-
-        # TODO: refactor
-        # splits the AudioSegment into "chunks" of barks
-        chunks = pydub.silence.split_on_silence(audio,
-            min_silence_len = 100,  # length in ms when a chunk is declared as a chunk
-
-            silence_thresh = -35,   # threshold in dbfs that is used to detect non-silence
-            keep_silence = 50       # amount of time in ms to keep
-        )
-
-        # summation of bark length
-        bl = 0.0
-        for i , chunk in enumerate(chunks):
-            print(len(chunk))
-            bl = bl + float(len(chunk) / sampleRate)
-        
-        # getting the average bark length
+    # '--jobs N' extracts N sets at the same time
+    JOBS = 1
+    if args.count("--jobs"):
         try:
-            bark_len = bl / float(len(chunks))
+            JOBS = int(args[args.index("--jobs") + 1])
         except Exception as e:
-            bark_len = 0
-
-        tempRow['bark_length'] = bark_len
-
-        ##################################################################
-
-        # calculating interbark interval
-        ibi = get_IBI(data,sr)
-        tempRow['interbark_interval'] = ibi
-
-        # - - FREQUENCY DOMAIN FEATURE EXTRACTION FOLLOWS - -
-
-        # DOING FFT
-        fftData, w = doFFT(data, sr)
-        
-        # gets the maximum index
-        max_index = np.argmax(fftData)
-        # gets the maximum value
-        max = np.amax(fftData)
+            print("Please include the number of jobs after --jobs")
+            sys.exit()
 
-        # gets the corresponding frequency with the highest amplitude
-        pitch = w[max_index] 
-
-        tempRow['pitch'] = pitch
-
-        # # --- FOR VISUALIZATION PURPOSES ONLY ---
-
-        # # x is w (frequency steps)
-        # # y is fftData (amplitude values)
-        # plt.plot(w, fftData)
-        
-        # # shows filename and labels in the plot
-        # plt.title(currentSequence['filename'])
-        # plt.xlabel('frequency')
-        # plt.ylabel('amplitude')
-        # #plt.show()
-
-        # # --- FOR VISUALIZATION PURPOSES ONLY ---
-
-        # obtaining tone quality/roughness
-        roughness = get_roughness(fftData, max)
+    # '--features a,b' only computes (and writes) the features named, see features.FEATURES
+    FEATURES = None
+    if args.count("--features"):
+        try:
+            FEATURES = features.selected_features(args[args.index("--features") + 1].split(','))
+        except IndexError as e:
+            print("Please include the names of the features after --features")
+            sys.exit()
+        except ValueError as e:
+            print(e)
+            sys.exit()
+
+        print("extracting only", ', '.join(FEATURES))
+
+    # 'rebuild' extracts every split again instead of using the values kept in the store
+    REBUILD = args.count("rebuild") > 0
+
+    targetFolder = 'data'
+
+    # the splits of every recording (set), as listed in the manifests written by preprocess.py
+    # (splits made before the manifests existed are listed from their filenames)
+    # example:  split-barks-0.wav
+    #           is a part of the 'barks' set
+    manifests = manifest.list_splits(targetFolder)
+
+    print(len(manifests), "sets,", sum(len(m['splits']) for m in manifests), "splits")
+
+    # the values of the splits are kept by the hash of the split file and of the extraction settings
+    settings = cache.settings_hash(store.extraction_settings())
+    values = {} if REBUILD else store.load_store(store.STORE_FILE, settings)
+
+    # values every split needs in the store (the rest of the features are computed with the rows)
+    needed = ['dbfs'] + features.split_features(FEATURES)
+
+    hashes = {}
+    todo = []
+    missing = []
+    for m in manifests:
+        # a set with a split that is gone (deleted or moved since the manifest was written) is reported as failed,
+        # the values of its other splits are still kept in the store
+        gone = [entry['filename'] for entry in m['splits'] if not os.path.isfile(targetFolder + '/' + entry['filename'])]
+        if gone:
+            print("warning:", m['set'], "is missing", ', '.join(gone))
+            missing.append(m['set'])
+            hashes[m['set']] = [cache.file_hash(targetFolder + '/' + entry['filename']) for entry in m['splits']
+                if entry['filename'] not in gone]
+            continue
+
+        hashes[m['set']] = [cache.file_hash(targetFolder + '/' + entry['filename']) for entry in m['splits']]
+
+        # only the splits that are new, changed or missing a selected feature are read
+        splits = [dict(entry, hash=split_hash) for entry, split_hash in zip(m['splits'], hashes[m['set']])
+            if split_hash not in values or any(name not in values[split_hash] for name in needed)]
+        if splits:
+            todo.append({ 'set' : m['set'], 'splits' : splits })
+
+    print(sum(len(m['splits']) for m in todo), "splits to extract,", len(values), "kept in the store")
+
+    if EXPERIMENT:
+        output_filename = 'output_experiment.csv'
+    else:
+        output_filename = 'output.csv'
+    fieldnames = features.fieldnames(FEATURES, EXPERIMENT)
+
+    print("start of read")
+
+    if JOBS > 1:
+        print("Extracting with", JOBS, "jobs...")
+
+    # the sets are extracted one at a time (one per worker with --jobs) in the same order as the manifests,
+    # and the rows of every set are written as soon as its values are known
+    # (the audio of a set is released before the next one is read)
+    extracted = features.extracted_sets(todo, targetFolder, BATCHED, JOBS, FEATURES)
+    todoSets = set(m['set'] for m in todo)
+    failed = []
+
+    with open(output_filename, mode='w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+
+        writer.writeheader()
+
+        # set : the original name of the unsplit wav files
+        for done, m in enumerate(manifests):
+            if m['set'] in missing:
+                failed.append(m['set'])
+                print("[" + str(done + 1) + "/" + str(len(manifests)) + "]", m['set'], "failed (missing splits)")
+                continue
+
+            if m['set'] in todoSets:
+                extractedSet, setValues, error = next(extracted)
+                if error is not None:
+                    failed.append(m['set'])
+                    print("[" + str(done + 1) + "/" + str(len(manifests)) + "]", m['set'], "failed")
+                    continue
+
+                # remembers the values of the splits that were extracted (with the ones already kept)
+                for entry, splitValues in zip(extractedSet['splits'], setValues):
+                    values[entry['hash']] = dict(values.get(entry['hash'], {}), **splitValues)
+
+            # the rows of the set, made from the values in the store
+            filenames = [entry['filename'] for entry in m['splits']]
+            rows = features.rows_from_values(m['set'], filenames, [values[split_hash] for split_hash in hashes[m['set']]], EXPERIMENT, FEATURES)
+            for row in rows:
+                writer.writerow(row)
+
+            print("[" + str(done + 1) + "/" + str(len(manifests)) + "]", m['set'], "done,", len(rows), "rows")
+
+    if failed:
+        print(len(failed), "set(s) failed:")
+        for key in failed:
+            print("   ", key)
+
+    # keeps only the splits that still exist
+    kept = set(split_hash for m in manifests for split_hash in hashes[m['set']])
+    values = { split_hash : splitValues for split_hash, splitValues in values.items() if split_hash in kept }
+    store.save_store(store.STORE_FILE, settings, values)
+
+    print('success')
+    print('output saved as ', output_filename)
+
+    if EXPERIMENT:
+        exit()
         
-        tempRow['roughness'] = roughness
-        if not EXPERIMENT:
-            tempRow['aggressive'] = classif
-
-        allForExport.append(tempRow)
-
-print('saving...')
-
-if EXPERIMENT:
-    output_filename = 'output_experiment.csv'
-    fieldnames = ['name','perceptual_spread','bark_length','interbark_interval','roughness', 'pitch']
-else:
-    output_filename = 'output.csv'
-    fieldnames = ['name','perceptual_spread','bark_length','interbark_interval','roughness', 'pitch','aggressive']
-    
-with open(output_filename, mode='w', newline='') as csv_file:
-    writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-
-    writer.writeheader()
-    for row in allForExport:
-        writer.writerow(row)
-
-print('success')
-print('output saved as ', output_filename)
-
-if EXPERIMENT:
-    exit()
-    
-import pandas as pd 
-
-data = pd.read_csv(output_filename)
-data = data.sample(frac=1).reset_index(drop=True)
+    import pandas as pd 
 
-shuffled_filename = output_filename.split('.')[:1][0] +  '_shuffled.csv'
+    data = pd.read_csv(output_filename)
+    data = data.sample(frac=1).reset_index(drop=True)
 
-data.to_csv( shuffled_filename )
+    shuffled_filename = output_filename.split('.')[:1][0] +  '_shuffled.csv'
 
-print('shuffled dataset saved as ', shuffled_filename )
+    data.to_csv( shuffled_filename )
 
+    print('shuffled dataset saved as ', shuffled_filename )
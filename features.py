@@ -0,0 +1,495 @@
+# used in the array computations
+import numpy as np
+
+# used to obtain project constants
+import constants
+
+# used in the fourier transform, pitch and roughness
+import spectral
+
+# used in obtaining the dbfs
+import audio
+
+# used in sharing the intermediates of a split between the features
+import analysis
+
+# used in the bark lengths and interbark intervals from the inputs
+import segmenter
+
+# used in reading the splits of a set
+import manifest
+
+# used in extracting several sets at the same time (--jobs)
+import workers
+import contextlib
+import io
+import traceback
+
+# used in loading the custom features (see constants.FEATURE_PLUGINS)
+import importlib
+
+# used in checking that the values of the split features can be kept in the store
+import numbers
+
+# inputs a feature can be computed from (see register_feature)
+SPLIT_INPUTS = ['dbfs', 'samples', 'envelope', 'onsets', 'spectrum', 'stft']
+SET_INPUTS = ['set_loudness']
+
+# every feature extract.py can write, by csv column, in the order of the columns (see register_feature)
+FEATURES = {}
+
+'''------------------------------------
+CLASSIFICATION OBTAINER:
+    receives the name of a set,
+    returns 1 if the set is aggressive (its name starts with 'aggr_'), 0 otherwise
+    (assumes that one set is of only one classification aggressive/non-aggressive)
+------------------------------------'''
+def get_classification(set_name):
+    classif = str(set_name).split('_')[0]
+    if classif == 'aggr':
+        return 1
+    return 0
+
+'''------------------------------------
+SEQUENCE MAKER:
+    receives the filename of a split, its samples (one channel) and sample rate,
+    returns the sequence object extract.py works with (filename, data, sr and dbfs)
+
+    float splits are turned into 32-bit pcm the way they are when a float wav
+    is read back with pydub (see audio.to_pcm), the dbfs is computed unless it is given
+------------------------------------'''
+def make_sequence(filename, data, sr, dbfs=None):
+    data = audio.to_pcm(data)
+
+    if dbfs is None:
+        dbfs = audio.dbfs(data)
+
+    return {
+        'filename' : filename,
+        'data' : data,
+        'sr' : sr,
+        'dbfs' : dbfs
+    }
+
+'''------------------------------------
+AVERAGE LOUDNESS OBTAINER:
+    receives object ( the array that contains all sequences ),
+    returns mean loudness of the entire file ( object )
+------------------------------------'''
+def get_average_loudness( obj ):
+    meanLoudness = 0
+
+    # does a summation of the loudness for each sequence
+    for sequence in range(len(obj)):
+        currentSequence = obj[sequence]
+        meanLoudness += currentSequence['dbfs']
+
+    # gets the average
+    return meanLoudness / len(obj)
+
+'''------------------------------------
+AVERAGE INTERBARK INTERVAL OBTAINER:
+    receives data stream (integer pcm or float), sample rate and its analysis (optional),
+    returns mean interbark interval
+    (onsets found with array operations in segmenter.py, through analysis.py)
+------------------------------------'''
+def get_IBI(data, fs, signal=None):
+    if signal is None:
+        signal = analysis.SignalAnalysis(data, fs)
+    onsets, mean = signal.interbark_intervals()
+
+    print(len(onsets), "barks detected")
+
+    return mean
+
+'''------------------------------------
+BARK LENGTH OBTAINER:
+    receives data stream, sample rate and its analysis (optional),
+    returns the average length of the barks
+    (same units as before: the chunk lengths in ms divided by the sample rate)
+------------------------------------'''
+def get_bark_length(data, sampleRate, signal=None):
+    if signal is None:
+        signal = analysis.SignalAnalysis(data, sampleRate)
+
+    # lengths (in ms) of the "chunks" of barks, split on the silences in between
+    chunks = signal.chunk_lengths(
+        constants.MIN_SILENCE_LEN,  # length in ms when a chunk is declared as a chunk
+        constants.SILENCE_THRESH,   # threshold in dbfs that is used to detect non-silence
+        constants.KEEP_SILENCE      # amount of time in ms to keep
+    )
+
+    return average_bark_length(chunks, sampleRate)
+
+'''------------------------------------
+AVERAGE BARK LENGTH:
+    receives the lengths (ms) of the chunks of barks and the sample rate,
+    returns the average length of the barks (see get_bark_length)
+------------------------------------'''
+def average_bark_length(chunks, sampleRate):
+    # summation of bark length
+    bl = 0.0
+    for chunk in chunks:
+        print(chunk)
+        bl = bl + float(chunk / sampleRate)
+
+    # getting the average bark length
+    try:
+        bark_len = bl / float(len(chunks))
+    except Exception as e:
+        bark_len = 0.0
+
+    return bark_len
+
+'''------------------------------------
+LOUDNESS EXTRACTOR:
+    receives frequency domain data and maximum detected frequency,
+    returns the "rougness" of the data
+    (masked reductions from spectral.py, no frequency axis needed)
+------------------------------------'''
+def get_roughness(fftData, max):
+    return float(spectral.roughness_of(np.asarray(fftData), np.array([max])))
+
+'''------------------------------------
+FOURIER TRANSFORM:
+    receives data stream and sample rate,
+    returns amplitudes (fourier_to_plot) and corresponding frequencies (w)
+    (real-input fft from spectral.py, zero-padded as set in constants.FFT_PADDING)
+------------------------------------'''
+def doFFT(data, sampleRate):
+    return spectral.amplitude_spectrum(data, sampleRate)
+
+'''------------------------------------
+PITCH AND ROUGHNESS OBTAINER:
+    receives the amplitude spectrum of a split and its frequencies (w),
+    returns the frequency with the highest amplitude (pitch) and the tone quality/roughness
+------------------------------------'''
+def get_pitch_roughness(fftData, w):
+    pitch, roughness = spectral.spectral_features(fftData, w)
+
+    # # --- FOR VISUALIZATION PURPOSES ONLY ---
+
+    # # x is w (frequency steps)
+    # # y is fftData (amplitude values)
+    # plt.plot(w, fftData)
+
+    # # shows filename and labels in the plot
+    # plt.xlabel('frequency')
+    # plt.ylabel('amplitude')
+    # #plt.show()
+
+    # # --- FOR VISUALIZATION PURPOSES ONLY ---
+
+    return pitch, roughness
+
+'''------------------------------------
+FEATURE INPUTS:
+    what the compute function of a feature receives
+    inputs[name] returns an input the feature declared (see register_feature), computed only when
+    it is asked for, and raises a KeyError for the inputs it did not declare
+    (signal is the analysis of the split, see analysis.py, None when the rows are made)
+------------------------------------'''
+class FeatureInputs:
+    def __init__(self, values, signal=None, set_loudness=None, declared=None):
+        # values of the split known so far (at least its dbfs)
+        self.values = values
+        self.signal = signal
+        self.set_loudness = set_loudness
+        self.declared = declared
+
+    def __getitem__(self, name):
+        if self.declared is not None and name not in self.declared:
+            raise KeyError("'" + name + "' is not one of the inputs of the feature (" + ', '.join(self.declared) + ")")
+
+        if name == 'set_loudness':
+            return self.set_loudness
+        if name in self.values:
+            return self.values[name]
+        if self.signal is None:
+            raise KeyError(name)
+        if name == 'samples':
+            return self.signal.data, self.signal.sr
+        if name == 'envelope':
+            return self.signal.envelope(constants.MIN_SILENCE_LEN)
+        if name == 'onsets':
+            return self.signal.interbark_intervals()[0]
+        if name == 'spectrum':
+            return self.signal.spectrum()
+        if name == 'stft':
+            return self.signal.stft()
+        raise KeyError(name)
+
+    # the inputs of one feature
+    def of(self, name):
+        return FeatureInputs(self.values, self.signal, self.set_loudness, FEATURES[name]['inputs'])
+
+'''------------------------------------
+FEATURE REGISTERER:
+    receives the name of a feature (its csv column), the inputs it is computed from
+    and the function that computes it (receives a FeatureInputs, returns the value),
+    adds the feature to FEATURES (after the ones already there)
+
+    the value must be a number (int, float or a numpy scalar): the values of the split features
+    are kept in the store as float64 columns (see store.save_store), a split feature that returns
+    anything else fails its set with a ValueError
+
+    inputs:
+        'dbfs'          loudness of the split
+        'samples'       samples and sample rate of the split
+        'envelope'      loudness (dBFS) of the MIN_SILENCE_LEN ms window at every millisecond (bark length)
+        'onsets'        onset indices of the barks (interbark interval)
+        'spectrum'      amplitude spectrum of the whole split and its frequencies (pitch, roughness)
+        'stft'          short-time spectrum of the split and its frequencies (frame pitch)
+        'set_loudness'  mean loudness of the splits of the set
+
+    features with a set input are computed when the rows are made (they change with the rest of the set,
+    so from the values kept for the split, only the dbfs can be used with them), the others once per split
+    (kept in the store)
+------------------------------------'''
+def register_feature(name, inputs, compute):
+    unknown = [i for i in inputs if i not in SPLIT_INPUTS + SET_INPUTS]
+    if unknown:
+        raise ValueError("unknown input(s) for feature '" + name + "': " + ', '.join(unknown))
+
+    # the samples of a split are gone by the time the rows of its set are made
+    mixed = [i for i in inputs if i in SPLIT_INPUTS and i != 'dbfs']
+    if mixed and any(i in SET_INPUTS for i in inputs):
+        raise ValueError("feature '" + name + "' mixes set inputs with split input(s): " + ', '.join(mixed)
+            + " (only 'dbfs' can be used with a set input)")
+
+    FEATURES[name] = { 'inputs' : list(inputs), 'compute' : compute }
+
+def compute_perceptual_spread(inputs):
+    return inputs['set_loudness'] - inputs['dbfs']
+
+def compute_bark_length(inputs):
+    sampleRate = inputs['samples'][1]
+    chunks = segmenter.envelope_chunk_lengths(inputs['envelope'], sampleRate,
+        constants.MIN_SILENCE_LEN, constants.SILENCE_THRESH, constants.KEEP_SILENCE)
+    return average_bark_length(chunks, sampleRate)
+
+def compute_IBI(inputs):
+    data, fs = inputs['samples']
+    onsets = inputs['onsets']
+    print(len(onsets), "barks detected")
+    return segmenter.mean_interbark_interval(onsets, len(data), fs)
+
+def compute_roughness(inputs):
+    return get_pitch_roughness(*inputs['spectrum'])[1]
+
+def compute_pitch(inputs):
+    # median of the short frames (see constants.PITCH_METHOD)
+    if constants.PITCH_METHOD == 'frames':
+        return analysis.median_peak(*analysis.frame_peaks(*inputs['stft']))
+    return get_pitch_roughness(*inputs['spectrum'])[0]
+
+register_feature('perceptual_spread', ['dbfs', 'set_loudness'], compute_perceptual_spread)
+register_feature('bark_length', ['samples', 'envelope'], compute_bark_length)
+register_feature('interbark_interval', ['samples', 'onsets'], compute_IBI)
+register_feature('roughness', ['spectrum'], compute_roughness)
+register_feature('pitch', ['stft'] if constants.PITCH_METHOD == 'frames' else ['spectrum'], compute_pitch)
+
+'''------------------------------------
+FEATURE SELECTION:
+    receives the names of the features to compute (None for all of them),
+    returns them in the order of FEATURES
+------------------------------------'''
+def selected_features(names=None):
+    if names is None:
+        return list(FEATURES.keys())
+
+    unknown = [name for name in names if name not in FEATURES]
+    if unknown:
+        raise ValueError("unknown feature(s): " + ', '.join(unknown) + " (available: " + ', '.join(FEATURES.keys()) + ")")
+
+    return [name for name in FEATURES if name in names]
+
+# features (of the selected ones) computed for every split, so only these need the samples
+def split_features(names=None):
+    return [name for name in selected_features(names)
+        if not any(i in SET_INPUTS for i in FEATURES[name]['inputs'])]
+
+# intermediates needed by the selected features
+def needed_inputs(names=None):
+    return set(i for name in selected_features(names) for i in FEATURES[name]['inputs'])
+
+# columns of the csv files written by extract.py
+def fieldnames(names=None, experiment=False):
+    columns = ['name'] + selected_features(names)
+    if not experiment:
+        columns.append('aggressive')
+    return columns
+
+'''------------------------------------
+SPLIT VALUES:
+    receives a sequence (from make_sequence), the names of the features to compute (None for all)
+    and its amplitude spectrum (if already computed, see spectral.batch_spectra),
+    returns the values of the split every row is made from (its dbfs and every selected split feature)
+    (every feature is taken from one analysis of the split, see analysis.py,
+    so only the intermediates of the selected features are computed)
+------------------------------------'''
+def split_values(sequence, names=None, spectrum=None):
+    signal = analysis.SignalAnalysis(sequence['data'], sequence['sr'])
+
+    if spectrum is not None:
+        signal.cached('spectrum', lambda: spectrum)
+
+    print("---S T A R T for", sequence['filename'])
+
+    values = { 'dbfs' : sequence['dbfs'] }
+
+    inputs = FeatureInputs(values, signal)
+    for name in split_features(names):
+        values[name] = stored_value(name, FEATURES[name]['compute'](inputs.of(name)))
+
+    return values
+
+# the value of a split feature as the store keeps it (see register_feature)
+def stored_value(name, value):
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        raise ValueError("feature '" + name + "' returned " + repr(value) + ", split features must return a number")
+    return float(value)
+
+'''------------------------------------
+SET VALUES:
+    receives the sequences of a set, if the spectra are computed in batches
+    and the names of the features to compute (None for all),
+    returns the values of every split (see split_values, in the same order)
+------------------------------------'''
+def set_values(sequences, batched=False, names=None):
+    if not batched or 'spectrum' not in needed_inputs(names):
+        return [split_values(sequence, names) for sequence in sequences]
+
+    # amplitude spectra of every split of the set, computed in length buckets
+    spectra = spectral.batch_spectra(
+        [sequence['data'] for sequence in sequences],
+        [sequence['sr'] for sequence in sequences]
+    )
+
+    return [split_values(sequence, names, spectra[i]) for i, sequence in enumerate(sequences)]
+
+'''------------------------------------
+ROWS FROM VALUES:
+    receives the name of a set, the filenames of its splits, their values (see split_values),
+    if the rows are for the experiment (no 'aggressive' column) and the names of the features (None for all),
+    returns the csv rows of the set (one per split, in the same order)
+------------------------------------'''
+def rows_from_values(key, filenames, values, experiment=False, names=None):
+    rows = []
+
+    if not values:
+        return rows
+
+    if not experiment:
+        print("-------------------------------------")
+        print("Processing **" + str(key) + "** recording")
+        classif = get_classification(key)
+    print("-------------------------------------")
+
+    # getting the average loudness (for perceptual spread)
+    meanLoudness = get_average_loudness(values)
+    print(meanLoudness)
+
+    # the part where rows are filled in
+    for filename, splitValues in zip(filenames, values):
+        # name is the file name
+        tempRow = { 'name' : filename }
+
+        # features of the split, or computed with the loudness of the set (like the perceptual spread)
+        inputs = FeatureInputs(splitValues, set_loudness=meanLoudness)
+        for name in selected_features(names):
+            if name in splitValues:
+                tempRow[name] = splitValues[name]
+            else:
+                tempRow[name] = FEATURES[name]['compute'](inputs.of(name))
+
+        if not experiment:
+            tempRow['aggressive'] = classif
+
+        rows.append(tempRow)
+
+    return rows
+
+'''------------------------------------
+SET ROWS:
+    receives the name of a set, its sequences (from make_sequence), if the rows are for the experiment
+    (no 'aggressive' column), if the spectra of the set are computed in batches
+    and the names of the features (None for all),
+    returns the csv rows of the set (one per sequence, in the same order)
+------------------------------------'''
+def set_rows(key, sequences, experiment=False, batched=False, names=None):
+    filenames = [sequence['filename'] for sequence in sequences]
+
+    return rows_from_values(key, filenames, set_values(sequences, batched, names), experiment, names)
+
+'''------------------------------------
+SET READER:
+    receives the manifest of a set and the folder of the splits,
+    returns the sequences of the set (see make_sequence)
+------------------------------------'''
+def read_set(m, folder='data'):
+    sequences = []
+
+    for entry in m['splits']:
+        filename, data, sr, dbfs = manifest.read_split(entry, folder)
+        sequences.append(make_sequence(filename, data, sr, dbfs))
+        print(">>> got " + folder + '/' + filename)
+
+    return sequences
+
+'''------------------------------------
+VALUES WORKER:
+    receives the manifest of a set (or of the splits of a set that have to be extracted),
+    the folder of the splits, if the spectra are computed in batches and the names of the features (None for all),
+    reads the splits and computes their values while keeping everything it prints,
+    returns the set name, the printed log, the values (see split_values) and the error (None if there was no error)
+------------------------------------'''
+def values_worker(m, folder='data', batched=False, names=None):
+    log = io.StringIO()
+    values = []
+    error = None
+
+    with contextlib.redirect_stdout(log):
+        try:
+            values = set_values(read_set(m, folder), batched, names)
+        except Exception as e:
+            error = traceback.format_exc()
+
+    return m['set'], log.getvalue(), values, error
+
+'''------------------------------------
+SET EXTRACTOR:
+    receives the manifests of the sets to extract, the folder of the splits,
+    if the spectra are computed in batches, the amount of worker processes and the names of the features (None for all),
+    yields every set with the values of its splits (None if the set failed) and the error,
+    one set at a time and in the same order as the manifests
+
+    only the audio of the set being extracted is in memory (one set per worker when jobs > 1),
+    it is released as soon as its values are computed
+------------------------------------'''
+def extracted_sets(manifests, folder='data', batched=False, jobs=1, names=None):
+    if jobs <= 1:
+        for m in manifests:
+            try:
+                yield m, set_values(read_set(m, folder), batched, names), None
+            except Exception as e:
+                error = traceback.format_exc()
+                print(error, end='')
+                yield m, None, error
+        return
+
+    # a worker that dies only fails its own set (see workers.pool_results)
+    calls = [(m, folder, batched, names) for m in manifests]
+    for m, (result, error) in zip(manifests, workers.pool_results(values_worker, calls, jobs)):
+        if error is None:
+            key, log, values, error = result
+            print(log, end='')
+        if error is not None:
+            print(error, end='')
+            values = None
+        yield m, values, error
+
+
+# custom features register themselves when their module is imported (see constants.FEATURE_PLUGINS)
+for plugin in constants.FEATURE_PLUGINS:
+    importlib.import_module(plugin)
@@ -0,0 +1,166 @@
+# used in building the filter coefficients
+import numpy as np
+
+# used in applying the filters (second-order sections)
+from scipy import signal
+
+# sample rate that pysndfx hands to sox for numpy arrays
+# (reduce_noise_centroid_mb never passes the real one, so the shelves are designed against this rate)
+SOX_ARRAY_RATE = 44100
+
+# settings of the noise reduction chain in reduce_noise_centroid_mb
+SHELF_GAIN = -15.0
+SHELF_SLOPE = 1.0
+LIMITER_GAIN = -12.0
+
+# limiter gain of the 'vol' effect that sox runs for 'gain -l' (pysndfx's limiter)
+LIMITER_AMOUNT = 0.05
+
+# largest accepted sample difference between the sox and scipy backends
+# (None until it is measured with compare_with_sox against a real sox,
+# until then the scipy chain is a model of the sox chain, not a drop-in replacement)
+TOLERANCE = None
+
+'''------------------------------------
+SHELF FILTER DESIGN:
+    receives the kind of shelf ('low' or 'high'), gain (dB), corner frequency, slope and sample rate,
+    returns one second-order section [b0, b1, b2, a0, a1, a2] (a0 normalized to 1)
+
+    same biquads as sox's 'bass' and 'treble' effects (Audio EQ Cookbook shelves)
+------------------------------------'''
+def shelf_sos(kind, gain, frequency, slope, sr):
+    # sox refuses a corner outside (0, nyquist), this keeps the filter stable instead
+    frequency = min(max(float(frequency), 1.0), sr / 2.0 - 1.0)
+
+    A = 10.0 ** (gain / 40.0)
+    w0 = 2.0 * np.pi * frequency / sr
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / 2.0 * np.sqrt((A + 1.0 / A) * (1.0 / slope - 1.0) + 2.0)
+    sqrt_A_alpha = 2.0 * np.sqrt(A) * alpha
+
+    if kind == 'low':
+        b0 = A * ((A + 1) - (A - 1) * cos_w0 + sqrt_A_alpha)
+        b1 = 2 * A * ((A - 1) - (A + 1) * cos_w0)
+        b2 = A * ((A + 1) - (A - 1) * cos_w0 - sqrt_A_alpha)
+        a0 = (A + 1) + (A - 1) * cos_w0 + sqrt_A_alpha
+        a1 = -2 * ((A - 1) + (A + 1) * cos_w0)
+        a2 = (A + 1) + (A - 1) * cos_w0 - sqrt_A_alpha
+    elif kind == 'high':
+        b0 = A * ((A + 1) + (A - 1) * cos_w0 + sqrt_A_alpha)
+        b1 = -2 * A * ((A - 1) + (A + 1) * cos_w0)
+        b2 = A * ((A + 1) + (A - 1) * cos_w0 - sqrt_A_alpha)
+        a0 = (A + 1) - (A - 1) * cos_w0 + sqrt_A_alpha
+        a1 = 2 * ((A - 1) - (A + 1) * cos_w0)
+        a2 = (A + 1) - (A - 1) * cos_w0 - sqrt_A_alpha
+    else:
+        raise ValueError("shelf kind must be 'low' or 'high'")
+
+    return np.array([b0, b1, b2, a0, a1, a2]) / a0
+
+'''------------------------------------
+LIMITER:
+    receives audio time series (y) and gain (dB),
+    returns the time series with the gain applied the way sox's 'vol' effect does it with a limiter gain
+    (LIMITER_AMOUNT): over the level where gain * y would reach full scale - LIMITER_AMOUNT * (1 - y),
+    the sample is brought to that instead (sample by sample, so it needs no state between blocks)
+
+    with a gain under 1 that level is above full scale, so only the gain is applied
+    (taken from the sox sources, not measured against a sox binary, see TOLERANCE)
+------------------------------------'''
+def limiter(y, gain):
+    multiplier = 10.0 ** (gain / 20.0)
+    y = y * multiplier
+
+    if multiplier > LIMITER_AMOUNT:
+        # level of the input samples where the limiter starts
+        threshold = (1.0 - LIMITER_AMOUNT) / (multiplier - LIMITER_AMOUNT)
+        over = np.abs(y) > threshold * multiplier
+        if np.any(over):
+            x = y[over] / multiplier
+            y[over] = np.sign(x) * (1.0 - LIMITER_AMOUNT * (1.0 - np.abs(x)))
+
+    return y
+
+'''------------------------------------
+NOISE REDUCTION CHAIN:
+    lowshelf -> highshelf -> limiter, with the filter state carried across blocks
+    receives the lowest and highest spectral centroid (the shelf corners) and the design sample rate,
+    process() receives the next block, returns the filtered block as float32
+------------------------------------'''
+class NoiseReductionChain:
+    def __init__(self, threshold_l, threshold_h, sr=SOX_ARRAY_RATE):
+        self.sos = np.vstack([
+            shelf_sos('low', SHELF_GAIN, threshold_l, SHELF_SLOPE, sr),
+            shelf_sos('high', SHELF_GAIN, threshold_h, SHELF_SLOPE, sr),
+        ])
+
+        # sox starts every biquad from rest
+        self.zi = np.zeros((self.sos.shape[0], 1, 2))
+
+    def process(self, block):
+        if len(block) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        # sox clips the output of every effect to full scale
+        y = block
+        for i in range(len(self.sos)):
+            y, self.zi[i] = signal.sosfilt(self.sos[i:i + 1], y, zi=self.zi[i])
+            np.clip(y, -1.0, 1.0, out=y)
+
+        return limiter(y, LIMITER_GAIN).astype(np.float32)
+
+    '''------------------------------------
+    WHOLE SERIES:
+        receives audio time series (y) and the block size,
+        returns the filtered time series as one float32 array
+        (filtered a block at a time, so the float64 copies of the filters stay small,
+        same samples as process() on the whole series)
+    ------------------------------------'''
+    def process_all(self, y, block_size=2**18):
+        y_filtered = np.empty(len(y), dtype=np.float32)
+
+        for i in range(0, len(y), block_size):
+            y_filtered[i:i + block_size] = self.process(y[i:i + block_size])
+
+        return y_filtered
+
+'''------------------------------------
+SOX COMPARISON:
+    receives audio time series (y) and sample rate (sr),
+    returns the largest sample difference between the 'sox' and 'scipy' backends
+    of reduce_noise_centroid_mb (needs sox installed, the differences measured on real
+    recordings are what TOLERANCE should be set from)
+------------------------------------'''
+def compare_with_sox(y, sr):
+    # imported here since preprocess imports this module
+    import preprocess
+
+    y_sox = preprocess.reduce_noise_centroid_mb(y, sr, backend='sox')
+    y_scipy = preprocess.reduce_noise_centroid_mb(y, sr, backend='scipy')
+
+    # sox might return a few samples more or less
+    length = min(len(y_sox), len(y_scipy))
+
+    return float(np.max(np.abs(y_sox[:length] - y_scipy[:length])))
+
+# compares the backends on wav files (only reports the differences while TOLERANCE is not measured)
+# usage: python filters.py [wav files...]
+if __name__ == '__main__':
+    import sys
+    import librosa
+
+    ok = True
+
+    for sound_file in sys.argv[1:]:
+        y, sr = librosa.load(sound_file)
+        difference = compare_with_sox(y, sr)
+        print(sound_file, "largest difference:", difference)
+        if TOLERANCE is not None and difference > TOLERANCE:
+            ok = False
+
+    if TOLERANCE is None:
+        print("no TOLERANCE measured yet, set it from the largest difference above")
+    elif ok:
+        print("scipy backend matches sox")
+    else:
+        sys.exit(1)
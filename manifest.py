@@ -0,0 +1,156 @@
+# used in computing the loudness of the splits
+import audio
+
+# used in reading the splits
+import numpy as np
+from scipy.io.wavfile import read
+
+# used in writing the manifests (through a temporary file)
+import cache
+
+# used in finding the manifests
+import os
+
+# manifests are named manifest-<recording>.json, one per recording
+MANIFEST_PREFIX = 'manifest-'
+
+'''------------------------------------
+MANIFEST FILENAME:
+    receives the name of a recording (the set name) and the folder of the splits,
+    returns the path of the manifest of the recording
+------------------------------------'''
+def manifest_file(fileName, folder='data'):
+    return folder + '/' + MANIFEST_PREFIX + fileName + '.json'
+
+'''------------------------------------
+SPLIT ENTRY:
+    receives the path of a split, its start and end sample in the cleaned recording,
+    the sample rate and the samples of the split,
+    returns the manifest entry of the split
+    (the dbfs is the one extract.py would get from reading the split back with pydub)
+------------------------------------'''
+def split_entry(filename, startidx, endidx, sr, data):
+    return {
+        'filename' : filename.split('/')[-1],
+        'start' : int(startidx),
+        'end' : int(endidx),
+        'sr' : int(sr),
+        'duration' : (endidx - startidx) / float(sr),
+        'dbfs' : float(audio.dbfs(audio.to_pcm(data)))
+    }
+
+'''------------------------------------
+MANIFEST WRITER:
+    receives the name of a recording, the path of the raw recording, the sample rate,
+    the entries of its splits (in order), the folder of the splits and where the split
+    recording comes from in the raw one (origin: its sample rate 'source_sr' and the sample
+    'trim_start' where the trimmed audio starts, at sr; None when the splits were made
+    from the source file as it is),
+    writes the manifest of the recording and returns its path
+
+    start and end of every split are samples of the cleaned recording (at sr, after the trim),
+    source_start and source_end the same moments as samples of the raw recording
+------------------------------------'''
+def write_manifest(fileName, source, sr, entries, folder='data', origin=None):
+    path = manifest_file(fileName, folder)
+
+    if origin is None:
+        origin = { 'source_sr' : sr, 'trim_start' : 0 }
+    source_sr = int(origin['source_sr'])
+    trim_start = int(origin['trim_start'])
+
+    for entry in entries:
+        entry['source_start'] = source_sample(entry['start'], sr, source_sr, trim_start)
+        entry['source_end'] = source_sample(entry['end'], sr, source_sr, trim_start)
+
+    cache.save_index(path, {
+        'set' : fileName,
+        'source' : source,
+        'sr' : int(sr),
+        'source_sr' : source_sr,
+        'trim_start' : trim_start,
+        'splits' : entries
+    })
+
+    return path
+
+'''------------------------------------
+SOURCE SAMPLE:
+    receives a sample of the cleaned recording, its sample rate, the sample rate of the raw recording
+    and the sample where the trimmed audio starts (at sr),
+    returns the same moment as a sample of the raw recording
+------------------------------------'''
+def source_sample(sample, sr, source_sr, trim_start=0):
+    return int(round((trim_start + sample) * float(source_sr) / sr))
+
+'''------------------------------------
+MANIFEST READER:
+    receives the folder of the splits,
+    returns the manifests of every recording, sorted by set name
+    (manifests that cannot be read are left out)
+------------------------------------'''
+def load_manifests(folder='data'):
+    manifests = []
+
+    if not os.path.isdir(folder):
+        return manifests
+
+    for s in sorted(os.listdir(folder)):
+        if s.startswith(MANIFEST_PREFIX) and s.endswith('.json'):
+            manifest = cache.load_index(folder + '/' + s)
+            if 'set' in manifest and 'splits' in manifest:
+                manifests.append(manifest)
+
+    return sorted(manifests, key=lambda manifest: manifest['set'])
+
+'''------------------------------------
+SPLIT READER:
+    receives the manifest entry of a split and the folder of the splits,
+    returns the filename, the samples of the first channel, the sample rate and the dbfs of the split
+    (the dbfs in the manifest is used, so only the samples are read)
+------------------------------------'''
+def read_split(entry, folder='data'):
+    filestr = folder + '/' + entry['filename']
+
+    if 'dbfs' in entry:
+        fs, data = read(filestr, mmap=True)
+        if data.ndim > 1:
+            data = data[:, 0]
+        return entry['filename'], data, fs, entry['dbfs']
+
+    # splits listed without a manifest are read with pydub like before
+    import pydub
+
+    # making a pydub AudioSegment from the wav file pointed to by the filename
+    sound = pydub.AudioSegment.from_wav(filestr)
+
+    # parsing the data steam (a view of the raw bytes, frames x channels)
+    # (pydub keeps 8-bit audio signed)
+    dtype = { 1 : np.int8, 2 : np.int16, 4 : np.int32 }[sound.sample_width]
+    data = np.frombuffer(sound.raw_data, dtype=dtype).reshape(-1, sound.channels)
+
+    return entry['filename'], data[:, 0], sound.frame_rate, sound.dBFS
+
+'''------------------------------------
+SPLIT LISTER:
+    receives the folder of the splits,
+    returns the manifests of every recording (see load_manifests), or when there are none,
+    manifests made from the filenames of the splits (split-<set>-<number>.wav)
+------------------------------------'''
+def list_splits(folder='data'):
+    manifests = load_manifests(folder)
+    if manifests:
+        return manifests
+
+    listed = {}
+    for s in sorted(os.listdir(folder)):
+        if s.startswith('split-') and s.split('.')[-1] == 'wav':
+            # the set name may contain '-', the number is after the last one
+            name, number = s[len('split-'):-len('.wav')].rsplit('-', 1)
+            listed.setdefault(name, []).append((int(number), s))
+
+    for name in sorted(listed.keys()):
+        splits = [{ 'filename' : filename } for number, filename in sorted(listed[name])]
+        manifests.append({ 'set' : name, 'splits' : splits })
+
+    return manifests
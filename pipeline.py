@@ -0,0 +1,98 @@
+# used in the file enumeration
+import os
+
+# used in cleaning and (optionally) writing the splits
+import preprocess
+
+# used in finding the bark sequences
+import segmenter
+
+# used in computing the feature rows
+import features
+
+# used in obtaining arguments and writing the csv file
+import sys
+import csv
+
+'''------------------------------------
+RECORDING SPLITTER:
+    receives the path of a raw recording and if the splits are also written to 'data',
+    cleans and splits the recording in memory,
+    returns the name of the recording (the set name) and its sequences (see features.make_sequence)
+------------------------------------'''
+def recording_sequences(file_path, write_splits=False):
+    y, sr, fileName, origin = preprocess.clean_recording(file_path)
+
+    # the recording is searched once, the written splits have the same bounds as the sequences
+    bounds, peaks = segmenter.find_sequences(y, sr)
+
+    if write_splits:
+        preprocess.split_audio(y, sr, fileName, file_path, origin, bounds)
+
+    sequences = []
+    for i, (startidx, endidx) in enumerate(bounds):
+        # same name the split file has (or would have)
+        filename = 'split-' + fileName + '-' + str(i) + '.wav'
+        sequences.append(features.make_sequence(filename, y[startidx:endidx], sr))
+
+    return fileName, sequences
+
+'''------------------------------------
+RECORDING LISTER:
+    receives the path of a raw recording or of a folder with raw recordings,
+    returns the paths of the wav recordings (sorted)
+------------------------------------'''
+def list_recordings(path):
+    if not os.path.isdir(path):
+        return [path]
+
+    recordings = []
+    for s in sorted(os.listdir(path)):
+        if s.split('.')[-1] == 'wav':
+            recordings.append(path.rstrip('/') + '/' + s)
+    return recordings
+
+'''------------------------------------
+FEATURE ROWS:
+    receives the path of a raw recording (or of a folder with raw recordings), if the rows are
+    for the experiment, if the splits are also written to 'data', if the spectra are computed in batches
+    and the names of the features (None for all),
+    yields the rows extract.py would write to the csv file, one recording at a time
+    (no split has to be written and read back)
+------------------------------------'''
+def feature_rows(path, experiment=False, write_splits=False, batched=False, names=None):
+    for file_path in list_recordings(path):
+        key, sequences = recording_sequences(file_path, write_splits)
+
+        for row in features.set_rows(key, sequences, experiment, batched, names):
+            yield row
+
+
+# writes the csv file straight from the raw recordings
+# usage: python pipeline.py <recording or folder> [exp] [writesplits] [batch] [--features a,b]
+if __name__ == '__main__':
+    EXPERIMENT = sys.argv.count("exp") > 0
+    WRITE_SPLITS = sys.argv.count("writesplits") > 0
+    BATCHED = sys.argv.count("batch") > 0
+
+    FEATURES = None
+    if sys.argv.count("--features"):
+        FEATURES = features.selected_features(sys.argv[sys.argv.index("--features") + 1].split(','))
+
+    if WRITE_SPLITS:
+        preprocess.makeFolders(preprocess.foldersIfNotShowAll)
+
+    if EXPERIMENT:
+        output_filename = 'output_experiment.csv'
+    else:
+        output_filename = 'output.csv'
+    fieldnames = features.fieldnames(FEATURES, EXPERIMENT)
+
+    with open(output_filename, mode='w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+
+        writer.writeheader()
+        for row in feature_rows(sys.argv[1], EXPERIMENT, WRITE_SPLITS, BATCHED, FEATURES):
+            writer.writerow(row)
+
+    print('output saved as ', output_filename)
@@ -1,11 +1,12 @@
-# used in analysis (spectral centroid) and wav file reads
+# used in silence trimming
 import librosa
-# used in obtaining the min/max value in the analysis
-import numpy as np
+# used in analysis (spectral centroid)
+import analysis
 # used in normalization
-import pydub
+import audio
 # used in applying effects for noise reduction
 import pysndfx
+import filters
 
 # reading and writing the wav files
 from scipy.io.wavfile import read
@@ -18,9 +19,27 @@ import shutil
 # used to obtain project constants
 import constants
 
+# used in finding the bark sequences
+import segmenter
+
 # used in obtaining arguments
 import sys
 
+# used in the block-based preprocessing of long recordings
+import stream
+
+# used in skipping recordings that were already preprocessed
+import cache
+
+# used in listing the splits of every recording
+import manifest
+
+# used in preprocessing several recordings at the same time (--jobs)
+import workers
+import contextlib
+import io
+import traceback
+
 # functions that will delete/create folders
 def deleteFolders(folderNames):
     for folder in folderNames:
@@ -36,57 +55,39 @@ def makeFolders(folderNames):
 
 # foldernames in that will be used when doing showall and not showall
 foldersIfShowAll = ['normalized','toBeSplit','data']
-foldersIfNotShowAll = ['temp','data']
+foldersIfNotShowAll = ['data']
 
-# checks the arguments sent if 'showall' is used
-if len(sys.argv) > 1:
-    if str(sys.argv[1]) == "showall":
-        SHOWALL = True
-        deleteFolders(foldersIfNotShowAll)
-        makeFolders(foldersIfShowAll)
-        print("Showing all output")
-    else:
-        SHOWALL = False
-        deleteFolders(foldersIfShowAll)
-        makeFolders(foldersIfNotShowAll)
-        print("not showing all output")
-else:
-    SHOWALL = False
-    deleteFolders(foldersIfShowAll)
-    makeFolders(foldersIfNotShowAll)
-    print("not showing all output")
-    
+# every folder the preprocessing has written to ('temp' was used before the fused pipeline)
+allFolders = ['temp','normalized','toBeSplit','data']
 
-'''------------------------------------
-FILE READER:
-    receives filename,
-    returns audio time series (y) and sampling rate of y (sr)
-------------------------------------'''
-def read_file(file_name):
-    # uses librosa to get the time series and sample rate
-    y, sr = librosa.load(file_name)
+# amount of samples searched for barks at a time when splitting
+SPLIT_BLOCK_SIZE = 2**20
 
-    return y, sr
+# keeps the hash of every preprocessed recording and its splits (used by 'incremental')
+CACHE_FILE = 'data/preprocess_cache.json'
 
 '''------------------------------------
 NOISE REDUCTION:
-    receives audio time series (y) , sample rate (sr)
+    receives audio time series (y) , sample rate (sr) and the backend ('sox' or 'scipy', optional)
     returns (y_clean_boosted) as audio time series
 ------------------------------------'''
-def reduce_noise_centroid_mb(y, sr):
+def reduce_noise_centroid_mb(y, sr, backend=None):
+    if backend is None:
+        backend = constants.NOISE_REDUCTION_BACKEND
 
-    cent = librosa.feature.spectral_centroid(y=y, sr=sr)
-    
-    # gets centroid
-    threshold_h = np.max(cent)      # highest centroid (freq)
-    threshold_l = np.min(cent)      # lowest centroid (freq)
+    # same centroids as librosa.feature.spectral_centroid (see analysis.py)
+    threshold_l, threshold_h = analysis.SignalAnalysis(y, sr).centroid_range()    # lowest and highest centroid (freq)
+
+    # model of the same chain without sox (second-order sections on the array, see filters.TOLERANCE)
+    if backend == 'scipy':
+        return filters.NoiseReductionChain(threshold_l, threshold_h).process_all(y, audio.CHUNK_SIZE)
     
     # generating filters/"audio effects" (modifying the audio)
     less_noise = (
         pysndfx.AudioEffectsChain()
-        .lowshelf(gain=-15.0, frequency=threshold_l, slope=1.0)
-        .highshelf(gain=-15.0, frequency=threshold_h, slope=1.0)
-        .limiter(gain=-12.0)
+        .lowshelf(gain=filters.SHELF_GAIN, frequency=threshold_l, slope=filters.SHELF_SLOPE)
+        .highshelf(gain=filters.SHELF_GAIN, frequency=threshold_h, slope=filters.SHELF_SLOPE)
+        .limiter(gain=filters.LIMITER_GAIN)
     )
 
     # applies the generated effects to the data time series
@@ -97,7 +98,8 @@ def reduce_noise_centroid_mb(y, sr):
 '''------------------------------------
 SILENCE TRIMMER:
     receives an audio matrix,
-    returns an audio matrix with less silence and the amout of time that was trimmed
+    returns an audio matrix with less silence, the amout of time that was trimmed
+    and the sample where the kept audio starts
 ------------------------------------'''
 def trim_silence(y):
     # trimming silence
@@ -106,12 +108,77 @@ def trim_silence(y):
     # getting the trim length
     trimmed_length = librosa.get_duration(y) - librosa.get_duration(y_trimmed)
 
-    return y_trimmed, trimmed_length
+    return y_trimmed, trimmed_length, int(index[0])
 
 '''------------------------------------
 SPLITTING ALGORITHM:
+    recieves audio time series (data), sample rate (fs), the filename of the recording
+    the path of the raw recording, where data comes from in it (origin, see manifest.write_manifest)
+    and the bark sequences as (start, end) sample indices when they are already known
+    (see segmenter.find_sequences, the search is skipped),
+    outputs splits on folder named 'data' as audio files, with a manifest of them
+    (data/manifest-<filename>.json: offsets, sample rate, duration and dbfs of every split),
+    returns the filenames of the splits
+
+    the time series is searched SPLIT_BLOCK_SIZE samples at a time and every bark sequence
+    is written (straight from a view of data) as soon as it ends, so a memory-mapped
+    recording never has to be read as a whole
+------------------------------------'''
+def split_audio(data, fs, fileName, source=None, origin=None, bounds=None):
+
+    print("splitting **" , fileName, "**")
+
+    # keeps the splitting state from one block to the next
+    tracker = segmenter.SequenceTracker(fs)
+
+    written = []
+    entries = []
+
+    # exporting a split time series into a separate audio file
+    def export(startidx, endidx):
+        filename = 'data/split-' + fileName + '-' + str(len(written)) + '.wav'
+        try:
+            write(filename,fs,data[startidx:endidx])
+        except Exception as e:
+            os.mkdir("data")
+            write(filename,fs,data[startidx:endidx])
+        written.append(filename)
+        entries.append(manifest.split_entry(filename, startidx, endidx, fs, data[startidx:endidx]))
+
+    if bounds is not None:
+        for startidx, endidx in bounds:
+            export(startidx, endidx)
+        blocks = []
+    else:
+        blocks = range(0, len(data), SPLIT_BLOCK_SIZE)
+
+    for blockidx in blocks:
+        # finds the bark sequences (start and end indices) without walking every sample
+        sequences, peaks = tracker.feed(data[blockidx:blockidx + SPLIT_BLOCK_SIZE])
+
+        for peak in peaks:
+            print("found a peak in second", peak/fs)
+
+        for startidx, endidx in sequences:
+            export(startidx, endidx)
+
+    # to add the last bark sequence
+    for startidx, endidx in tracker.finish():
+        export(startidx, endidx)
+
+    print(len(written), " barks detected!")
+
+    manifest.write_manifest(fileName, source, fs, entries, origin=origin)
+
+    return written
+
+'''------------------------------------
+SPLITTING ALGORITHM (FROM A FILE):
     recieves sound files,
-    outputs splits on folder named 'data' as audio files
+    outputs splits on folder named 'data' as audio files,
+    returns the filenames of the splits
+    (the split-only path, measured by benchmark.py; preprocess_file splits the cleaned
+    time series it already holds in memory, so only this path reads the file memory-mapped)
 ------------------------------------'''
 def doTheSplit(sound_file):
 
@@ -122,67 +189,114 @@ def doTheSplit(sound_file):
     # removes the directories from the string
     fileName = fileName[0].split('/')[-1]
 
-    print("splitting **" , fileName, "**")
-    
-    # reads the sound file and gets the sample rate (fs) and time series (data)
-    fs, data = read(sound_file)
-    # value in which indices are "skipped" when a bark is detected
-    FOCUS_SIZE = int(constants.SECONDS * fs)
+    # maps the sound file into memory (only the parts being split are read)
+    # and gets the sample rate (fs) and time series (data)
+    fs, data = read(sound_file, mmap=True)
 
-    startidx = 0
+    return split_audio(data, fs, fileName, sound_file)
 
-    # iterator variable
-    idx = 0
+'''------------------------------------
+RECORDING CLEANER:
+    receives the path of a raw recording and if all output is shown,
+    normalizes, reduces the noise and trims the silence of the recording in memory
+    (writes the intermediate files when showall is used),
+    returns the cleaned time series, its sample rate, the name of the recording
+    and where the cleaned time series comes from in the raw recording
+    (origin: the sample rate of the recording and the sample where the trimmed audio starts)
+------------------------------------'''
+def clean_recording(file_path, showall=False):
+    s = file_path.split('/')[-1]
+    fileName = s.split('.')[0]
 
-    # to contain the audio series to be split
-    split = []
-    
-    # amount of indices when no barks were detected
-    # useful for estimating when a bark sequence ends
-    dead_air = 0
-
-    # a boolean "flag" that is used for when it's the last bark sequence in a recording
-    has_barks_inside = False
-
-    while idx < len(data):
-        # when the value in the current index exceeds the preset value
-        if ((data[idx] > constants.MIN_VAL_FOR_SPLITTING)):
-            has_barks_inside = True
-
-            print("found a peak in second", idx/fs)
-                
-            idx += FOCUS_SIZE
-            dead_air = 0
-            
-        else:
-            # if dead air exceeds the bark sequence timeout
-            if (dead_air/fs) > constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE:
-                print("dead air exceeded ", constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE)
-                if has_barks_inside:
-                    # adds the time series into the 'split' array for exporting
-                    split.append(data[startidx:idx])
-                startidx = idx
-                dead_air = 0
-                has_barks_inside = False
-            else:
-                dead_air += 1
-            idx += 1
+    # NORMALIZATION
+    # reads the recording as it is stored (int16 for most recorders)
+    fs, data = read(file_path)
 
+    # applies the gain that brings the recording to the target loudness (in place)
+    audio.normalize(data, constants.TARGET_DBFS)
 
-    # to add the last bark sequence
-    if has_barks_inside:
-        split.append(data[startidx:len(data)])
+    if showall:
+        write("normalized/" + s, fs, data)
+
+    # NOISE REDUCTION
+    # mono float time series at the working sample rate (every later stage uses this sr)
+    y, sr = audio.at_working_rate(audio.to_float(data), fs)
 
-    print(len(split), " barks detected!")
-    # exporting the split time series into separate audio files
-    for num in range(len(split)):
+    y_reduced_centroid_mb = reduce_noise_centroid_mb(y, sr)
+
+    y_reduced_centroid_mb, time_trimmed, trim_start = trim_silence(y_reduced_centroid_mb)
+
+    if showall:
+        write('toBeSplit/' + s , sr , y_reduced_centroid_mb )
+
+    origin = { 'source_sr' : fs, 'trim_start' : trim_start }
+
+    return y_reduced_centroid_mb, sr, fileName, origin
+
+'''------------------------------------
+FUSED PREPROCESSING:
+    receives the path of a raw recording and if all output is shown,
+    normalizes, reduces the noise, trims the silence and splits the recording in memory
+    outputs splits on folder named 'data' (and the intermediate files when showall is used),
+    returns the filenames of the splits
+------------------------------------'''
+def preprocess_file(file_path, showall=False):
+    y, sr, fileName, origin = clean_recording(file_path, showall)
+
+    # SPLITTING
+    return split_audio(y, sr, fileName, file_path, origin)
+
+'''------------------------------------
+RECORDING PREPROCESSOR:
+    receives the path of a raw recording, if all output is shown and if the recording is streamed,
+    returns the filenames of the splits
+------------------------------------'''
+def preprocess_recording(file_path, showall=False, streamed=False):
+    if streamed:
+        return stream.preprocess_stream(file_path)
+    return preprocess_file(file_path, showall)
+
+'''------------------------------------
+RECORDING WORKER:
+    receives the path of a raw recording, if all output is shown and if the recording is streamed,
+    preprocesses the recording while keeping everything it prints,
+    returns the path, the printed log, the filenames of the splits and the error (None if there was no error)
+------------------------------------'''
+def preprocess_worker(file_path, showall=False, streamed=False):
+    log = io.StringIO()
+    written = []
+    error = None
+
+    with contextlib.redirect_stdout(log):
         try:
-            write('data/split-' + fileName + '-' + str(num) + '.wav',fs,split[num])
+            written = preprocess_recording(file_path, showall, streamed)
         except Exception as e:
-            os.mkdir("data")
-            write('data/split-' + fileName + '-' + str(num) + '.wav',fs,split[num])
+            error = traceback.format_exc()
 
-    return 
+    return file_path, log.getvalue(), written, error
+
+'''------------------------------------
+PREPROCESSING SETTINGS:
+    receives if the recordings are streamed,
+    returns every setting that changes the splits (used as part of the cache key)
+    (with the noise reduction backend that is actually used, streamed recordings are always
+    filtered with the scipy chain, see stream.BACKEND)
+------------------------------------'''
+def preprocess_settings(streamed=False):
+    return {
+        'TARGET_DBFS' : constants.TARGET_DBFS,
+        'MIN_VAL_FOR_SPLITTING' : constants.MIN_VAL_FOR_SPLITTING,
+        'SECONDS' : constants.SECONDS,
+        'SECONDS_UNTIL_NEXT_BARK_SEQUENCE' : constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE,
+        'SAMPLE_RATE' : constants.SAMPLE_RATE,
+        'NATIVE_SAMPLE_RATES' : list(constants.NATIVE_SAMPLE_RATES),
+        'NOISE_REDUCTION_BACKEND' : stream.BACKEND if streamed else constants.NOISE_REDUCTION_BACKEND,
+        'SHELF_GAIN' : filters.SHELF_GAIN,
+        'SHELF_SLOPE' : filters.SHELF_SLOPE,
+        'LIMITER_GAIN' : filters.LIMITER_GAIN,
+        'LIMITER_AMOUNT' : filters.LIMITER_AMOUNT,
+        'streamed' : streamed
+    }
 
 
 '''--------------------------------------------------------------------------------------------------------------------------------------------------
@@ -196,129 +310,141 @@ def doTheSplit(sound_file):
 ----------------------------------------------------------------------------------------------------------------------------------------------------
 ----------------------------------------------------------------------------------------------------------------------------------------------------'''
 
-targetFolder = 'raw'
-
-toBePreprocessed = []
-toBePreprocessed = os.listdir(targetFolder)
-samples = []
-
-# filtering the list for wav files
-for s in toBePreprocessed:
-    container = s.split('.')[-1]
-    if container == 'wav':
-        samples.append(s)
+if __name__ == '__main__':
+    # 'incremental' keeps the splits of the recordings that did not change since the last run
+    INCREMENTAL = sys.argv.count("incremental") > 0
 
-# clears the temp folder
-for root, dirs, files in os.walk('temp'):
-    for f in files:
-        os.unlink(os.path.join(root, f))
-    for d in dirs:
-        shutil.rmtree(os.path.join(root, d))
-
-# ****************************************************************************************
-# ****************************************************************************************
-# ****************************************************************************************
-# Normalization First 
-# ****************************************************************************************
-# ****************************************************************************************
-# ****************************************************************************************
-
-TARGET_DBFS = constants.TARGET_DBFS
-
-print("Doing normalization...")
-for s in samples:
-    filePath = str(targetFolder) + '/' + str(s)
-    print(filePath)
-
-    # re-assigning the filepath
-    filename = filePath
-
-    # initializing an AudioSegment
-    fil = pydub.AudioSegment.from_wav(filename)
+    if INCREMENTAL:
+        foldersToDelete = [folder for folder in allFolders if folder != 'data']
+    else:
+        foldersToDelete = allFolders
 
-    # gets the difference between the target loudness and the loudness of the current audio file
-    dif = TARGET_DBFS - fil.dBFS
+    # checks the arguments sent if 'showall' is used
+    if sys.argv.count("showall"):
+        SHOWALL = True
+        deleteFolders(foldersToDelete)
+        makeFolders(foldersIfShowAll)
+        print("Showing all output")
+    else:
+        SHOWALL = False
+        deleteFolders(foldersToDelete)
+        makeFolders(foldersIfNotShowAll)
+        print("not showing all output")
 
-    # applying gain based on the difference in loudness
-    normalized = fil.apply_gain(dif)
+    # 'stream' reads the recordings block by block (for recordings that do not fit in memory)
+    STREAM = sys.argv.count("stream") > 0
 
-    # exports
-    if SHOWALL:
-        normalized.export("normalized/" + s, format="wav")
+    # '--jobs N' preprocesses N recordings at the same time
+    JOBS = 1
+    if sys.argv.count("--jobs"):
+        try:
+            JOBS = int(sys.argv[sys.argv.index("--jobs") + 1])
+        except Exception as e:
+            print("Please include the number of jobs after --jobs")
+            sys.exit()
+
+    targetFolder = 'raw'
+
+    toBePreprocessed = []
+    toBePreprocessed = os.listdir(targetFolder)
+    samples = []
+
+    # filtering the list for wav files
+    for s in sorted(toBePreprocessed):
+        container = s.split('.')[-1]
+        if container == 'wav':
+            samples.append(s)
+
+    # removes the splits of a recording listed in the cache (and their manifest)
+    def removeSplits(s, entry):
+        for filename in entry['splits'] + [manifest.manifest_file(s.split('.')[0])]:
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    # the recordings are keyed by the hash of their contents and of the settings
+    index = {}
+    hashes = {}
+    if INCREMENTAL:
+        index = cache.load_index(CACHE_FILE)
+        settings = cache.settings_hash(preprocess_settings(STREAM))
+
+        # recordings that are no longer in the raw folder
+        for s in sorted(index.keys()):
+            if s not in samples:
+                print("removing the splits of", s)
+                removeSplits(s, index.pop(s))
+
+        changed = []
+        for s in samples:
+            filePath = str(targetFolder) + '/' + str(s)
+            hashes[s] = cache.file_hash(filePath)
+            entry = index.get(s)
+
+            if entry is None:
+                changed.append(s)
+            elif entry['hash'] != hashes[s] or entry['settings'] != settings:
+                print(filePath, "changed")
+                removeSplits(s, index.pop(s))
+                changed.append(s)
+            elif not all(os.path.exists(filename) for filename in entry['splits']):
+                print(filePath, "is missing splits")
+                removeSplits(s, index.pop(s))
+                changed.append(s)
+            else:
+                print(filePath, "unchanged, skipping")
+
+        cache.save_index(CACHE_FILE, index)
+        samples = changed
+
+    # remembers the splits of a preprocessed recording
+    def remember(s, written):
+        if INCREMENTAL:
+            index[s] = { 'hash' : hashes[s], 'settings' : settings, 'splits' : written }
+            cache.save_index(CACHE_FILE, index)
+
+    # every recording goes to a worker process
+    # the logs are printed in the same order as the recordings, failed recordings are listed at the end
+    if JOBS > 1:
+        print("Preprocessing with", JOBS, "jobs...")
+        failed = []
+
+        calls = [(str(targetFolder) + '/' + str(s), SHOWALL, STREAM) for s in samples]
+
+        # a worker that dies only fails its own recording (see workers.pool_results)
+        for s, (result, poolError) in zip(samples, workers.pool_results(preprocess_worker, calls, JOBS)):
+            filePath = str(targetFolder) + '/' + str(s)
+            print(filePath)
+            if poolError is not None:
+                print(poolError, end='')
+                failed.append(filePath)
+                continue
+
+            filePath, log, written, error = result
+            print(log, end='')
+            if error is not None:
+                print(error, end='')
+                failed.append(filePath)
+            else:
+                remember(s, written)
+
+        if failed:
+            print(len(failed), "recording(s) failed:")
+            for filePath in failed:
+                print("   ", filePath)
+        print("Done!")
+        sys.exit()
+
+    # normalization, noise reduction, trimming and splitting done in one go per recording
+    # the audio is passed from one step to the next without writing it to disk
+    # (normalized/ and toBeSplit/ are only written when showall is used)
+    if STREAM:
+        print("Streaming...")
     else:
-        normalized.export("temp/" + s, format="wav")
-
-# ****************************************************************************************
-# ****************************************************************************************
-# ****************************************************************************************
-# Noise Reduction
-# ****************************************************************************************
-# ****************************************************************************************
-# ****************************************************************************************
-# Normalization
-if SHOWALL:
-    targetFolder = 'normalized'
-else:
-    targetFolder = 'temp'
-
-
-toBePreprocessed = []
-toBePreprocessed = os.listdir(targetFolder)
-samples = []
-
-# filtering the list for wav files
-for s in toBePreprocessed:
-    container = s.split('.')[-1]
-    if container == 'wav':
-        samples.append(s)
-
-print("Doing noise reduction...")
-for s in samples:
-    filePath = str(targetFolder) + '/' + str(s)
-
-    # reading a file
-    filename = filePath
-    y, sr = read_file(filename)
-    print(filename)
+        print("Doing normalization, noise reduction and splitting...")
+    for s in samples:
+        filePath = str(targetFolder) + '/' + str(s)
+        print(filePath)
 
-    y_reduced_centroid_mb = reduce_noise_centroid_mb(y, sr)
+        remember(s, preprocess_recording(filePath, SHOWALL, STREAM))
 
-    y_reduced_centroid_mb, time_trimmed = trim_silence(y_reduced_centroid_mb)
-    
-    if SHOWALL:
-        write('toBeSplit/' + s , sr , y_reduced_centroid_mb )
-    else:
-        write('temp/' + s , sr , y_reduced_centroid_mb )
-
-# ****************************************************************************************
-# ****************************************************************************************
-# ****************************************************************************************
-# S P L I T T I N G  S T A R T S 
-# ****************************************************************************************
-# ****************************************************************************************
-# ****************************************************************************************
-# set to target folder that contains audio files to be split
-if SHOWALL:
-    toBeSplitFolder = 'toBeSplit'
-else:
-    toBeSplitFolder = 'temp'
-
-toBeSplitItems = []
-toBeSplitItems = os.listdir(toBeSplitFolder)
-finalItems = []
-
-# filtering the list for wav files
-for s in toBeSplitItems:
-    container = s.split('.')[-1]
-    if container == 'wav':
-        finalItems.append(s)
-
-# Splitting
-for s in finalItems:
-    # reconstructing the file paths
-    filePath = str(toBeSplitFolder) + '/' + str(s)
-
-    # starts splitting   
-    doTheSplit(filePath)
-    
-print("Done!")
+    print("Done!")
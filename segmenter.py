@@ -0,0 +1,475 @@
+# used in finding the threshold crossings
+import numpy as np
+
+# used to obtain project constants
+import constants
+
+# used in scaling the interbark interval threshold
+import audio
+
+# used in obtaining arguments (parity check)
+import sys
+
+'''------------------------------------
+TIMEOUT IN SAMPLES:
+    receives sample rate (fs),
+    returns the number of silent samples it takes before a bark sequence is closed
+    (the first dead_air count where dead_air/fs > SECONDS_UNTIL_NEXT_BARK_SEQUENCE)
+------------------------------------'''
+def timeout_samples(fs):
+    timeout = int(np.floor(constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE * fs))
+
+    # the float comparison is done the same way as the original loop
+    while timeout > 0 and ((timeout - 1) / fs) > constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE:
+        timeout -= 1
+    while not ((timeout / fs) > constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE):
+        timeout += 1
+
+    return timeout
+
+'''------------------------------------
+SEQUENCE TRACKER:
+    the splitting state carried across blocks of audio
+    feed() receives the next block of the time series,
+    returns the bark sequences closed inside it as (start, end) sample indices and the detected peaks
+    finish() returns the last bark sequence (if any) once there is no more audio
+
+    only the peaks are iterated, every gap between two peaks is resolved at once
+------------------------------------'''
+class SequenceTracker:
+    def __init__(self, fs):
+        # value in which indices are "skipped" when a bark is detected
+        self.FOCUS_SIZE = int(constants.SECONDS * fs)
+
+        # amount of dead air that ends a bark sequence
+        self.TIMEOUT = timeout_samples(fs)
+
+        # amount of samples received so far
+        self.position = 0
+
+        # index where the search resumes (after a skip or after a timeout)
+        self.resume = 0
+
+        # start of the current (possibly open) bark sequence
+        self.startidx = 0
+
+        # a boolean "flag" that is used for when it's the last bark sequence in a recording
+        self.has_barks_inside = False
+
+    def feed(self, block):
+        block_start = self.position
+        self.position += len(block)
+
+        # every index in the block that exceeds the preset value
+        above = np.flatnonzero(block > constants.MIN_VAL_FOR_SPLITTING) + block_start
+
+        sequences = []
+        peaks = []
+
+        while True:
+            # next index above the threshold that is not inside a skipped region
+            pos = np.searchsorted(above, self.resume)
+            if pos < len(above):
+                peak = int(above[pos])
+            else:
+                peak = self.position
+
+            # timeouts that happen in the dead air before the next peak (or the end of the block)
+            # first one at resume + TIMEOUT, then one every TIMEOUT + 1 samples
+            if peak - self.resume > self.TIMEOUT:
+                timeouts = (peak - 1 - self.resume - self.TIMEOUT) // (self.TIMEOUT + 1) + 1
+                if self.has_barks_inside:
+                    sequences.append((self.startidx, self.resume + self.TIMEOUT))
+                self.startidx = self.resume + self.TIMEOUT + (timeouts - 1) * (self.TIMEOUT + 1)
+                self.resume = self.startidx + 1
+                self.has_barks_inside = False
+
+            if peak >= self.position:
+                break
+
+            self.has_barks_inside = True
+            peaks.append(peak)
+            self.resume = peak + self.FOCUS_SIZE
+
+        return sequences, peaks
+
+    def finish(self):
+        # to add the last bark sequence
+        if self.has_barks_inside:
+            self.has_barks_inside = False
+            return [(self.startidx, self.position)]
+        return []
+
+'''------------------------------------
+SEQUENCE FINDER:
+    receives audio time series (data) and sample rate (fs),
+    returns the bark sequences as (start, end) sample indices and the indices of the detected peaks
+    (same boundaries as the per-sample loop of doTheSplit)
+------------------------------------'''
+def find_sequences(data, fs):
+    tracker = SequenceTracker(fs)
+
+    sequences, peaks = tracker.feed(data)
+    sequences += tracker.finish()
+
+    return sequences, peaks
+
+'''------------------------------------
+ONSET FINDER:
+    receives a data stream, the threshold and the amount of samples skipped after an onset,
+    returns the indices where the stream exceeds the threshold, skipping focus_size samples
+    after each one (same onsets as checking sample by sample and jumping ahead)
+    (the indices above the threshold can be passed in if they are already known)
+------------------------------------'''
+def find_onsets(data, threshold, focus_size, above=None):
+    if above is None:
+        above = np.flatnonzero(data > threshold)
+
+    onsets = []
+    pos = 0
+    # only the samples above the threshold are visited
+    while pos < len(above):
+        onset = int(above[pos])
+        onsets.append(onset)
+        pos = np.searchsorted(above, onset + max(focus_size, 1), side='left')
+
+    return np.array(onsets, dtype=np.int64)
+
+'''------------------------------------
+IBI THRESHOLD:
+    receives a data stream (integer pcm or float),
+    returns constants.MIN_VAL on the scale of the stream
+    (the same level for every sample width, MIN_VAL itself for 32-bit pcm)
+------------------------------------'''
+def ibi_threshold(data):
+    return constants.MIN_VAL / float(constants.MIN_VAL_FULL_SCALE) * audio.full_scale(data)
+
+'''------------------------------------
+INTERBARK INTERVALS:
+    receives data stream, sample rate and the indices above ibi_threshold (optional, see analysis.py),
+    returns the onset indices of the barks and the mean interbark interval
+    (intervals are measured between the middle of the focus of each onset,
+    as a fraction of the length of the stream, 0.0 if there are less than two barks)
+------------------------------------'''
+def interbark_intervals(data, fs, above=None):
+    FOCUS_SIZE = int(constants.SECONDS * fs)
+
+    threshold = ibi_threshold(data)
+
+    # 8-bit wav files are unsigned, centered on 128
+    data = audio.signed(data)
+
+    onsets = find_onsets(data, threshold, FOCUS_SIZE, above)
+
+    return onsets, mean_interbark_interval(onsets, len(data), fs)
+
+'''------------------------------------
+MEAN INTERBARK INTERVAL:
+    receives the onset indices of the barks (see interbark_intervals), the length of the stream
+    and its sample rate,
+    returns the mean interbark interval (0.0 if there are less than two barks)
+------------------------------------'''
+def mean_interbark_interval(onsets, length, fs):
+    FOCUS_SIZE = int(constants.SECONDS * fs)
+
+    if len(onsets) < 2:
+        return 0.0
+
+    focuses = (onsets + FOCUS_SIZE // 2) / float(length)
+
+    return float(np.mean(np.diff(focuses)))
+
+'''------------------------------------
+WINDOW RMS:
+    receives a data stream (integer pcm or float), sample rate, window length (ms),
+    the running sum of the squared samples (optional, see analysis.py)
+    and the amount of windows (optional, every window that fits in the stream by default),
+    returns the rms of the window starting at every millisecond
+    (the same windows and values as pydub's audio_segment[i:i + window_ms].rms,
+    the windows past the end of the stream are cut short)
+------------------------------------'''
+def window_rms(data, fs, window_ms, cumulative=None, count=None):
+    seg_len = int(round(1000 * (len(data) / float(fs))))
+    if count is None:
+        count = seg_len - window_ms + 1
+
+    # millisecond positions turned into frames the way pydub does
+    starts = np.arange(0, count)
+    start_frames = (starts * (fs / 1000.0)).astype(np.int64)
+    end_frames = (np.minimum(starts + window_ms, seg_len) * (fs / 1000.0)).astype(np.int64)
+
+    if cumulative is None:
+        squares = audio.centered(data)
+        squares *= squares
+        cumulative = np.concatenate([[0.0], np.cumsum(squares)])
+
+    # windows that reach past the data are padded with silence (zeros)
+    sum_of_squares = cumulative[np.minimum(end_frames, len(data))] - cumulative[start_frames]
+    lengths = np.maximum(end_frames - start_frames, 1)
+
+    rms = np.sqrt(np.maximum(sum_of_squares, 0) / lengths)
+    rms[end_frames == start_frames] = 0
+
+    # audioop.rms gives a whole number for integer samples
+    if not np.issubdtype(data.dtype, np.floating):
+        rms = np.floor(rms)
+
+    return rms
+
+'''------------------------------------
+LOUDNESS ENVELOPE:
+    receives a data stream (integer pcm or float), sample rate, window length (ms)
+    and the running sum of the squared samples (optional, see window_rms),
+    returns the loudness (dBFS) of the window starting at every millisecond of the stream
+    (one value per millisecond, -inf where the window is silent)
+------------------------------------'''
+def loudness_envelope(data, fs, window_ms, cumulative=None):
+    seg_len = int(round(1000 * (len(data) / float(fs))))
+    rms = window_rms(data, fs, window_ms, cumulative, max(seg_len, 0))
+
+    with np.errstate(divide='ignore'):
+        return 20 * np.log10(rms / float(audio.full_scale(data)))
+
+'''------------------------------------
+CHUNK LENGTHS:
+    receives a data stream (integer pcm or float), sample rate, the minimum length of a silence (ms),
+    the silence threshold (dBFS), the silence kept around each chunk (ms)
+    and the running sum of the squared samples (optional, see window_rms),
+    returns the length (ms) of every non-silent chunk
+    (same chunks as pydub.silence.split_on_silence with seek_step 1, without building AudioSegments)
+------------------------------------'''
+def chunk_lengths(data, fs, min_silence_len, silence_thresh, keep_silence, cumulative=None):
+    envelope = loudness_envelope(data, fs, min_silence_len, cumulative)
+
+    return envelope_chunk_lengths(envelope, fs, min_silence_len, silence_thresh, keep_silence)
+
+'''------------------------------------
+CHUNK LENGTHS (FROM THE ENVELOPE):
+    receives the loudness envelope of a stream with min_silence_len windows (see loudness_envelope),
+    its sample rate, the minimum length of a silence (ms), the silence threshold (dBFS)
+    and the silence kept around each chunk (ms),
+    returns the length (ms) of every non-silent chunk (see chunk_lengths)
+------------------------------------'''
+def envelope_chunk_lengths(envelope, fs, min_silence_len, silence_thresh, keep_silence):
+    seg_len = len(envelope)
+
+    # silent windows, grouped into silent ranges (start ms, end ms)
+    silent_ranges = []
+    if seg_len >= min_silence_len:
+        # only the windows that fit in the stream (like pydub)
+        silence_starts = np.flatnonzero(envelope[:seg_len - min_silence_len + 1] <= silence_thresh)
+
+        if len(silence_starts):
+            # a new range begins where the silent windows stop overlapping
+            steps = np.diff(silence_starts)
+            breaks = np.flatnonzero((steps != 1) & (steps > min_silence_len))
+            firsts = np.concatenate([[0], breaks + 1])
+            lasts = np.concatenate([breaks, [len(silence_starts) - 1]])
+            silent_ranges = [[int(silence_starts[f]), int(silence_starts[l]) + min_silence_len] for f, l in zip(firsts, lasts)]
+
+    # non-silent ranges in between
+    if not silent_ranges:
+        ranges = [[0, seg_len]]
+    elif silent_ranges[0][0] == 0 and silent_ranges[0][1] == seg_len:
+        ranges = []
+    else:
+        ranges = []
+        prev_end = 0
+        for start, end in silent_ranges:
+            ranges.append([prev_end, start])
+            prev_end = end
+        if silent_ranges[-1][1] != seg_len:
+            ranges.append([prev_end, seg_len])
+        if ranges[0] == [0, 0]:
+            ranges.pop(0)
+
+    # keeps some silence around each chunk, split evenly where chunks would overlap
+    ranges = [[start - keep_silence, end + keep_silence] for start, end in ranges]
+    for first, second in zip(ranges, ranges[1:]):
+        if second[0] < first[1]:
+            first[1] = (first[1] + second[0]) // 2
+            second[0] = first[1]
+
+    lengths = []
+    for start, end in ranges:
+        start = min(max(start, 0), seg_len)
+        end = min(end, seg_len)
+        frames = max(int(end * (fs / 1000.0)) - int(start * (fs / 1000.0)), 0)
+        lengths.append(int(round(1000 * (frames / float(fs)))))
+
+    return lengths
+
+'''------------------------------------
+PYDUB COMPARISON:
+    receives a 32-bit pcm data stream, sample rate and the split_on_silence settings,
+    returns the chunk lengths of pydub.silence.split_on_silence and of chunk_lengths
+------------------------------------'''
+def compare_with_pydub(data, fs, min_silence_len, silence_thresh, keep_silence):
+    import pydub
+    import pydub.silence
+
+    segment = pydub.AudioSegment(data=data.astype(np.int32).tobytes(), sample_width=4, frame_rate=fs, channels=1)
+    chunks = pydub.silence.split_on_silence(segment,
+        min_silence_len=min_silence_len, silence_thresh=silence_thresh, keep_silence=keep_silence)
+
+    return [len(chunk) for chunk in chunks], chunk_lengths(data, fs, min_silence_len, silence_thresh, keep_silence)
+
+'''------------------------------------
+REFERENCE SPLITTER:
+    the original per-sample loop of doTheSplit, kept for parity checks
+    receives audio time series (data) and sample rate (fs),
+    returns the bark sequences as (start, end) sample indices
+------------------------------------'''
+def find_sequences_loop(data, fs):
+    FOCUS_SIZE = int(constants.SECONDS * fs)
+
+    startidx = 0
+    idx = 0
+    sequences = []
+    dead_air = 0
+    has_barks_inside = False
+
+    while idx < len(data):
+        if ((data[idx] > constants.MIN_VAL_FOR_SPLITTING)):
+            has_barks_inside = True
+            idx += FOCUS_SIZE
+            dead_air = 0
+        else:
+            if (dead_air/fs) > constants.SECONDS_UNTIL_NEXT_BARK_SEQUENCE:
+                if has_barks_inside:
+                    sequences.append((startidx, idx))
+                startidx = idx
+                dead_air = 0
+                has_barks_inside = False
+            else:
+                dead_air += 1
+            idx += 1
+
+    if has_barks_inside:
+        sequences.append((startidx, len(data)))
+
+    return sequences
+
+'''------------------------------------
+REFERENCE INTERBARK INTERVAL:
+    the original per-sample loop of get_IBI in extract.py, kept for parity checks
+    receives a 32-bit pcm data stream and sample rate,
+    returns the mean interbark interval
+------------------------------------'''
+def interbark_interval_loop(data, fs):
+    data_size = len(data)
+    FOCUS_SIZE = int(constants.SECONDS * fs)
+
+    focuses = []
+    distances = []
+    idx = 0
+
+    while idx < len(data):
+        if (data[idx] > constants.MIN_VAL):
+            mean_idx = idx + FOCUS_SIZE // 2
+            focuses.append(float(mean_idx) / data_size)
+            if len(focuses) > 1:
+                distances.append(focuses[-1] - focuses[-2])
+            idx += FOCUS_SIZE
+        else:
+            idx += 1
+
+    mean = 0
+    for val in distances:
+        mean += val
+
+    try:
+        mean = mean/len(distances)
+    except ZeroDivisionError as e:
+        mean = 0
+
+    return mean
+
+'''------------------------------------
+PARITY CHECK:
+    receives audio time series (data) and sample rate (fs),
+    returns True if the vectorized and the per-sample splitters agree
+------------------------------------'''
+def check_parity(data, fs):
+    fast, peaks = find_sequences(data, fs)
+    slow = find_sequences_loop(data, fs)
+
+    # the same recording fed in uneven blocks
+    tracker = SequenceTracker(fs)
+    blocked = []
+    cuts = np.unique(np.clip([1, 100, 4097, len(data) // 3, len(data) // 2 + 7], 0, len(data)))
+    for block in np.split(data, cuts):
+        blocked += tracker.feed(block)[0]
+    blocked += tracker.finish()
+
+    print(len(fast), "sequences (vectorized),", len(slow), "sequences (loop)")
+
+    return fast == slow and blocked == slow
+
+'''------------------------------------
+SYNTHETIC RECORDING:
+    receives a random seed, sample rate and duration (in seconds),
+    returns a noisy time series with short bursts that cross the splitting threshold
+------------------------------------'''
+def synthetic_barks(seed, fs=22050, duration=20.0):
+    rng = np.random.RandomState(seed)
+    data = (rng.randn(int(fs * duration)) * 0.02).astype(np.float32)
+
+    # bursts of random lengths with random gaps (some shorter than the timeout)
+    idx = rng.randint(0, fs)
+    while idx < len(data):
+        length = rng.randint(fs // 50, fs // 3)
+        data[idx:idx + length] += (rng.rand(min(length, len(data) - idx)) * 0.6).astype(np.float32)
+        idx += length + rng.randint(1, int(fs * 1.5))
+
+    return data
+
+
+# checks the splitter and the interbark interval against the original loops,
+# and the chunk lengths against pydub
+# usage: python segmenter.py [wav files...]
+if __name__ == '__main__':
+    from scipy.io.wavfile import read
+
+    ok = True
+
+    for seed in range(10):
+        for fs in (8000, 22050, 44100):
+            if not check_parity(synthetic_barks(seed, fs), fs):
+                print("mismatch on synthetic recording", seed, fs)
+                ok = False
+
+    for sound_file in sys.argv[1:]:
+        fs, data = read(sound_file)
+        print("checking **", sound_file, "**")
+        if not check_parity(data, fs):
+            print("mismatch on", sound_file)
+            ok = False
+
+    # the interbark interval on the same recordings as 32-bit pcm (exact),
+    # and as 16-bit pcm and float (the same level, up to rounding of the samples)
+    for seed in range(10):
+        data = synthetic_barks(seed)
+        pcm = (data.clip(-1, 1) * (2**31 - 1)).astype(np.int32)
+        slow = interbark_interval_loop(pcm, 22050)
+        for version, tolerance in ((pcm, 1e-12), ((pcm >> 16).astype(np.int16), 1e-3), (pcm / float(2**31), 1e-3)):
+            fast = interbark_intervals(version, 22050)[1]
+            if abs(fast - slow) > tolerance:
+                print("interbark interval mismatch on synthetic recording", seed, version.dtype, fast, slow)
+                ok = False
+
+    # the bark lengths against pydub (same settings as extract.py)
+    for seed in range(5):
+        for fs in (8000, 22050):
+            # quieter, so the noise between the bursts is under the silence threshold
+            pcm = (synthetic_barks(seed, fs, 6.0).clip(-1, 1) * (2**28)).astype(np.int32)
+            expected, lengths = compare_with_pydub(pcm, fs, constants.MIN_SILENCE_LEN,
+                constants.SILENCE_THRESH, constants.KEEP_SILENCE)
+            if expected != lengths:
+                print("chunk length mismatch on synthetic recording", seed, fs, expected, lengths)
+                ok = False
+
+    if ok:
+        print("vectorized splitter matches the loop")
+    else:
+        sys.exit(1)
@@ -0,0 +1,289 @@
+# used in the fft and the array reductions
+import numpy as np
+
+# used in obtaining the fast fft lengths (also in older scipy versions)
+from scipy.fftpack import next_fast_len
+
+# used in keeping the fft lengths and frequency axes
+import functools
+
+# used to obtain project constants
+import constants
+
+# used in obtaining arguments (comparison)
+import sys
+
+# largest amount of samples (rows x fft length) put in one batched transform
+BATCH_SAMPLES = 2**22
+
+'''------------------------------------
+FFT LENGTH:
+    receives the length of the data and the padding ('fast' or 'pow2'),
+    returns the length the data is zero-padded to
+    ('pow2' is the next power of 2 like the original doFFT,
+    'fast' is the next length made of small primes, at most a few percent longer)
+------------------------------------'''
+@functools.lru_cache(maxsize=256)
+def fft_length(len_data, padding='fast'):
+    if padding == 'pow2':
+        return int(2 ** int(np.ceil(np.log2(len_data))))
+    return int(next_fast_len(int(len_data)))
+
+'''------------------------------------
+FREQUENCY AXIS:
+    receives the fft length and sample rate,
+    returns the frequencies (w) of the first half of the spectrum
+    (same steps as np.linspace(0, sampleRate, n_fft) in the original doFFT)
+    the axis is kept per (n_fft, sampleRate) and is read-only
+------------------------------------'''
+@functools.lru_cache(maxsize=256)
+def frequency_axis(n_fft, sampleRate):
+    w = np.linspace(0, sampleRate, n_fft)[0:n_fft // 2]
+    w.flags.writeable = False
+    return w
+
+'''------------------------------------
+AMPLITUDE SPECTRUM:
+    receives data stream and sample rate,
+    returns amplitudes (fourier_to_plot) and corresponding frequencies (w)
+    (same contract as doFFT in extract.py)
+
+    only the real half of the spectrum is computed (real-input fft),
+    numpy keeps the twiddle factors of the lengths it has seen
+------------------------------------'''
+def amplitude_spectrum(data, sampleRate, padding=None):
+    if padding is None:
+        padding = constants.FFT_PADDING
+
+    n_fft = fft_length(len(data), padding)
+
+    # zero-pads the data to n_fft and transforms it
+    fft_data = np.fft.rfft(data, n=n_fft)
+
+    # absolute values of the first half (amplitude spectrum)
+    fourier_to_plot = np.abs(fft_data[0:n_fft // 2])
+
+    return fourier_to_plot, frequency_axis(n_fft, sampleRate)
+
+'''------------------------------------
+ROUGHNESS:
+    receives amplitude spectra (one per row) and the maximum of every row (as a column),
+    returns the roughness of every row: the mean of the points above PERCENT_OF_MAX of the max
+    (without the max itself) divided by the max
+    (rows without such points, or without any signal, have a roughness of 0)
+------------------------------------'''
+def roughness_of(spectra, max):
+    above = (spectra > max * constants.PERCENT_OF_MAX) & (spectra != max)
+    count = above.sum(axis=-1)
+    total = np.where(above, spectra, 0).sum(axis=-1)
+
+    max = max[..., 0]
+    roughness = np.zeros(count.shape)
+    valid = (count > 0) & (max > 0)
+    roughness[valid] = total[valid] / count[valid] / max[valid]
+
+    return roughness
+
+'''------------------------------------
+SPECTRAL FEATURES:
+    receives an amplitude spectrum (or one per row) and its frequencies (w),
+    returns the pitch (frequency with the highest amplitude) and the roughness
+    (numbers for one spectrum, arrays for rows of spectra)
+    everything is passed in, so it works the same in worker processes and batched code
+------------------------------------'''
+def spectral_features(spectra, w):
+    one = spectra.ndim == 1
+    spectra = np.atleast_2d(spectra)
+
+    max_index = np.argmax(spectra, axis=1)
+    max = spectra[np.arange(len(spectra)), max_index][:, None]
+
+    pitches = w[max_index]
+    roughness = roughness_of(spectra, max)
+
+    if one:
+        return pitches[0], roughness[0]
+    return pitches, roughness
+
+'''------------------------------------
+BATCHED SPECTRA:
+    receives a list of data streams and their sample rates (one per stream, or one for all),
+    yields the indices of a batch of streams, their amplitude spectra (one per row)
+    and the frequencies of the spectra (w), until every stream is transformed
+
+    streams that pad to the same fft length (and have the same sample rate) are put in one
+    2-D array and transformed together, at most BATCH_SAMPLES samples at a time
+------------------------------------'''
+def spectrum_batches(signals, sampleRates, padding=None):
+    if padding is None:
+        padding = constants.FFT_PADDING
+    if np.isscalar(sampleRates):
+        sampleRates = [sampleRates] * len(signals)
+
+    # groups the streams into length buckets
+    buckets = {}
+    for i, data in enumerate(signals):
+        key = (fft_length(len(data), padding), sampleRates[i])
+        buckets.setdefault(key, []).append(i)
+
+    for (n_fft, sampleRate), indices in buckets.items():
+        w = frequency_axis(n_fft, sampleRate)
+        rows = max(1, BATCH_SAMPLES // n_fft)
+
+        for first in range(0, len(indices), rows):
+            batch = indices[first:first + rows]
+
+            # zero-padded streams, one per row
+            padded = np.zeros((len(batch), n_fft))
+            for row, i in enumerate(batch):
+                padded[row, 0:len(signals[i])] = signals[i]
+
+            yield batch, np.abs(np.fft.rfft(padded, axis=1)[:, 0:n_fft // 2]), w
+
+'''------------------------------------
+BATCHED SPECTRAL FEATURES:
+    receives a list of data streams and their sample rates (one per stream, or one for all),
+    returns the pitch and roughness of every stream (arrays in the same order)
+------------------------------------'''
+def batch_features(signals, sampleRates, padding=None):
+    pitches = np.zeros(len(signals))
+    roughness = np.zeros(len(signals))
+
+    for batch, spectra, w in spectrum_batches(signals, sampleRates, padding):
+        pitches[batch], roughness[batch] = spectral_features(spectra, w)
+
+    return pitches, roughness
+
+'''------------------------------------
+BATCHED AMPLITUDE SPECTRA:
+    receives a list of data streams and their sample rates (one per stream, or one for all),
+    returns the amplitude spectrum of every stream (see amplitude_spectrum, in the same order)
+------------------------------------'''
+def batch_spectra(signals, sampleRates, padding=None):
+    spectra = [None] * len(signals)
+
+    for batch, rows, w in spectrum_batches(signals, sampleRates, padding):
+        for row, i in enumerate(batch):
+            spectra[i] = (rows[row], w)
+
+    return spectra
+
+'''------------------------------------
+REFERENCE FFT:
+    the hand-written Cooley-Tukey doFFT that was used in extract.py, kept for comparisons
+    receives data stream and sample rate,
+    returns amplitudes (fourier_to_plot) and corresponding frequencies (w)
+------------------------------------'''
+def cooley_tukey_spectrum(data, sampleRate):
+    len_data = len(data)
+
+    padded = np.zeros(2**(int(np.ceil(np.log2(len_data)))))
+    padded[0:len_data] = data
+
+    x = np.asarray(padded, dtype=float)
+    N = x.shape[0]
+
+    N_min = min(N, 32)
+
+    n = np.arange(N_min)
+    k = n[:, None]
+    M = np.exp(-2j * np.pi * n * k / N_min)
+    X = np.dot(M, x.reshape((N_min, -1)))
+
+    while X.shape[0] < N:
+        X_even = X[:, :X.shape[1] // 2]
+        X_odd = X[:, X.shape[1] //2:]
+        factor = np.exp(-1j * np.pi * np.arange(X.shape[0])
+                        / X.shape[0])[:, None]
+        X = np.vstack([X_even + factor * X_odd,
+                       X_even - factor * X_odd])
+
+    fft_data = X.ravel()
+    w = np.linspace(0, sampleRate, len(fft_data))
+
+    fourier_to_plot = np.abs(fft_data[0:len(fft_data)//2])
+    w = w[0:len(fft_data)//2]
+
+    return fourier_to_plot, w
+
+'''------------------------------------
+COMPARISON:
+    receives data stream and sample rate,
+    and the padding of amplitude_spectrum (constants.FFT_PADDING if not given),
+    returns the pitch and roughness of the reference fft and of amplitude_spectrum,
+    as two (pitch, roughness) tuples
+------------------------------------'''
+def compare_spectra(data, sampleRate, padding=None):
+    results = []
+
+    for fourier_to_plot, w in (cooley_tukey_spectrum(data, sampleRate), amplitude_spectrum(data, sampleRate, padding)):
+        results.append(spectral_features(fourier_to_plot, w))
+
+    return results[0], results[1]
+
+
+# compares the reference fft with amplitude_spectrum on synthetic splits and wav files,
+# reports the time and memory used on long sequences,
+# and compares batch_features with one transform per split
+# usage: python spectral.py [wav files...]
+if __name__ == '__main__':
+    import time
+    import tracemalloc
+    from scipy.io.wavfile import read
+
+    rng = np.random.RandomState(0)
+    signals = []
+    for seconds in (0.3, 1.1, 2.5):
+        t = np.arange(int(22050 * seconds)) / 22050.0
+        y = np.sin(2 * np.pi * rng.uniform(300, 1500) * t) + rng.randn(len(t)) * 0.3
+        signals.append(('synthetic ' + str(seconds) + 's', y, 22050))
+    for sound_file in sys.argv[1:]:
+        fs, data = read(sound_file)
+        # first channel, like extract.py
+        if data.ndim > 1:
+            data = data[:, 0]
+        signals.append((sound_file, data, fs))
+
+    for name, data, fs in signals:
+        # 'pow2' has the same bins as the reference, so it should give the same values
+        (pitch_ref, rough_ref), (pitch, rough) = compare_spectra(data, fs, 'pow2')
+        same = abs(pitch - pitch_ref) < 1e-6 and abs(rough - rough_ref) < 1e-6
+        print(name, "| pow2 matches the reference:", same)
+
+        # 'fast' has slightly different bins, the pitch should stay within one bin
+        (pitch_ref, rough_ref), (pitch, rough) = compare_spectra(data, fs, 'fast')
+        bin_width = float(fs) / fft_length(len(data), 'fast')
+        print(name, "| fast pitch", pitch_ref, "->", pitch, "(bin width %.2f Hz)" % bin_width,
+            "| roughness", rough_ref, "->", rough)
+
+    # speed and memory on long sequences
+    for seconds in (5, 30, 60):
+        data = rng.randn(int(22050 * seconds) + 1)
+        for label, function in (('cooley-tukey', cooley_tukey_spectrum), ('rfft', amplitude_spectrum)):
+            tracemalloc.start()
+            began = time.perf_counter()
+            function(data, 22050)
+            elapsed = time.perf_counter() - began
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(str(seconds) + "s", label, "| %.4f seconds" % elapsed, "| peak %.1f MB" % (peak / 2.0**20))
+
+    # batched against one transform per split, on many short splits
+    lengths = rng.randint(2000, 12000, size=400)
+    splits = [rng.randn(length) * 0.1 + np.sin(np.arange(length) * rng.uniform(0.05, 0.5)) for length in lengths]
+
+    began = time.perf_counter()
+    single = []
+    for data in splits:
+        fourier_to_plot, w = amplitude_spectrum(data, 22050)
+        single.append(spectral_features(fourier_to_plot, w))
+    single_time = time.perf_counter() - began
+
+    began = time.perf_counter()
+    pitches, roughness = batch_features(splits, 22050)
+    batch_time = time.perf_counter() - began
+
+    same_pitch = all(pitches[i] == single[i][0] for i in range(len(splits)))
+    largest = max(abs(roughness[i] - single[i][1]) for i in range(len(splits)))
+    print(len(splits), "splits | one by one %.4f seconds" % single_time, "| batched %.4f seconds" % batch_time)
+    print("same pitch:", same_pitch, "| largest roughness difference:", largest)
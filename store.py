@@ -0,0 +1,74 @@
+# used in keeping the feature columns
+import numpy as np
+
+# used in replacing the store file
+import os
+
+# used to obtain project constants
+import constants
+
+# values of every split extracted so far, keyed by the hash of the split file
+# (outside 'data', so it is kept when preprocess.py makes the splits again)
+STORE_FILE = 'feature_store.npz'
+
+'''------------------------------------
+EXTRACTION SETTINGS:
+    returns every setting that changes the values of a split (used as part of the store key)
+------------------------------------'''
+def extraction_settings():
+    return {
+        'MIN_VAL' : constants.MIN_VAL,
+        'MIN_VAL_FULL_SCALE' : constants.MIN_VAL_FULL_SCALE,
+        'SECONDS' : constants.SECONDS,
+        'PERCENT_OF_MAX' : constants.PERCENT_OF_MAX,
+        'FFT_PADDING' : constants.FFT_PADDING,
+        'MIN_SILENCE_LEN' : constants.MIN_SILENCE_LEN,
+        'SILENCE_THRESH' : constants.SILENCE_THRESH,
+        'KEEP_SILENCE' : constants.KEEP_SILENCE,
+        'PITCH_METHOD' : constants.PITCH_METHOD,
+        'PITCH_TOP_DB' : constants.PITCH_TOP_DB
+    }
+
+'''------------------------------------
+STORE READER:
+    receives the path of the store and the hash of the extraction settings,
+    returns the values of every split in the store as a dictionary (split hash -> values)
+    (empty if there is no store yet, it cannot be read or it was made with other settings,
+    features that were not computed for a split are left out of its values)
+------------------------------------'''
+def load_store(store_file, settings):
+    try:
+        with np.load(store_file) as columns:
+            if str(columns['settings']) != settings:
+                return {}
+
+            names = [column for column in columns.files if column not in ('settings', 'hashes')]
+
+            store = {}
+            for i, split_hash in enumerate(columns['hashes']):
+                store[str(split_hash)] = { column : float(columns[column][i]) for column in names
+                    if not np.isnan(columns[column][i]) }
+            return store
+    except Exception as e:
+        return {}
+
+'''------------------------------------
+STORE WRITER:
+    receives the path of the store, the hash of the extraction settings and the values of every split,
+    writes the store as one array per column (through a temporary file, so an interrupted run
+    never leaves half a store, features not computed for a split are kept as nan)
+
+    every value is a number (float64 columns, see features.register_feature)
+------------------------------------'''
+def save_store(store_file, settings, store):
+    hashes = sorted(store.keys())
+    names = sorted(set(column for values in store.values() for column in values))
+
+    columns = { column : np.array([store[split_hash].get(column, np.nan) for split_hash in hashes], dtype=np.float64)
+        for column in names }
+
+    # np.savez adds '.npz' to names without it
+    temp_file = store_file[:-len('.npz')] + '.tmp.npz'
+    np.savez(temp_file, settings=np.array(settings), hashes=np.array(hashes, dtype='U64'), **columns)
+
+    os.replace(temp_file, store_file)
@@ -0,0 +1,438 @@
+# used in the block computations
+import numpy as np
+
+# reading the raw wav files (memory-mapped) and writing the split wav files
+from scipy.io.wavfile import read
+from scipy.io.wavfile import write
+
+# used in creating the output folder
+import os
+
+# used to obtain project constants
+import constants
+
+# used in finding the bark sequences across blocks
+import segmenter
+
+# used in the noise reduction filters
+import filters
+
+# used in the normalization and resampling
+import audio
+
+# used in the spectral centroid framing
+import analysis
+
+# used in listing the splits of every recording
+import manifest
+
+# amount of frames read from the wav file at a time
+BLOCK_SIZE = 2**16
+
+# silence trimming settings (same as trim_silence in preprocess.py)
+TOP_DB = 20
+TRIM_HOP_LENGTH = 500
+
+# smallest power considered by the trimmer (librosa.power_to_db's amin)
+AMIN = 1e-10
+
+# noise reduction done by the streamed preprocessing, whatever constants.NOISE_REDUCTION_BACKEND says
+# (sox filters the whole recording at once, so the blocks go through filters.NoiseReductionChain)
+BACKEND = 'scipy'
+
+'''------------------------------------
+WAV OPENER:
+    receives filename,
+    returns the sample rate and the samples of the wav file (frames x channels)
+    (memory-mapped, so only the samples that are used are read, for every format the batch
+    path reads: integer pcm, IEEE float and WAVE_FORMAT_EXTENSIBLE files;
+    24-bit files cannot be mapped, they are read as a whole)
+------------------------------------'''
+def open_wav(file_name):
+    try:
+        fs, data = read(file_name, mmap=True)
+    except ValueError:
+        fs, data = read(file_name)
+
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+
+    return fs, data
+
+'''------------------------------------
+BLOCK READER:
+    receives filename and block size,
+    yields blocks of the recording as float32 arrays (frames x channels) scaled to [-1, 1)
+------------------------------------'''
+def read_blocks(file_name, block_size=BLOCK_SIZE):
+    data = open_wav(file_name)[1]
+
+    for first in range(0, len(data), block_size):
+        block = data[first:first + block_size].astype(np.float32)
+
+        # 8-bit wav files are unsigned
+        if data.dtype == np.uint8:
+            block -= 128
+        if not np.issubdtype(data.dtype, np.floating):
+            block /= audio.full_scale(data)
+
+        yield block
+
+'''------------------------------------
+SAMPLE RATE OBTAINER:
+    receives filename,
+    returns the sample rate of the wav file
+------------------------------------'''
+def read_rate(file_name):
+    return open_wav(file_name)[0]
+
+'''------------------------------------
+STAGES:
+    generators that receive the blocks of the previous stage
+    and yield the processed blocks
+------------------------------------'''
+# applies the normalization gain (in dB) and keeps the samples in range
+def normalized(blocks, gain):
+    for block in blocks:
+        yield audio.apply_gain(block, gain)
+
+# mixes down to one channel (like librosa.load)
+def mono(blocks):
+    for block in blocks:
+        yield block.mean(axis=1, dtype=np.float32)
+
+# brings the audio to the working sample rate
+def resampled(blocks, resampler):
+    for block in blocks:
+        yield resampler.process(block)
+
+    rest = resampler.finish()
+    if len(rest):
+        yield rest
+
+# runs the lowshelf/highshelf/limiter chain
+def filtered(blocks, chain):
+    for block in blocks:
+        yield chain.process(block)
+
+# only lets the samples in [start, end) through
+def trimmed(blocks, start, end):
+    position = 0
+    for block in blocks:
+        block_start = position
+        position += len(block)
+
+        lo = max(start - block_start, 0)
+        hi = min(end - block_start, len(block))
+        if lo < hi:
+            yield block[lo:hi]
+
+'''------------------------------------
+LOUDNESS METER:
+    the first pass over a recording
+    update() receives a raw block (frames x channels),
+    dbfs() returns the loudness once all blocks are seen (over every sample of every channel, like pydub)
+------------------------------------'''
+class Loudness:
+    def __init__(self):
+        self.sum_of_squares = 0.0
+        self.count = 0
+
+    def update(self, block):
+        self.sum_of_squares += float(np.dot(block.ravel(), block.ravel()))
+        self.count += block.size
+
+    def dbfs(self):
+        if self.count == 0 or self.sum_of_squares == 0:
+            return -float('inf')
+        return 10 * np.log10(self.sum_of_squares / self.count)
+
+'''------------------------------------
+CENTROID ANALYZER:
+    the second pass over a recording (same frames as analysis.SignalAnalysis)
+    receives the working sample rate,
+    update() receives a normalized mono block at that rate,
+    centroid_range() returns the lowest and highest centroid once all blocks are seen
+------------------------------------'''
+class Analyzer:
+    def __init__(self, sr):
+        self.sr = sr
+
+        self.frames = analysis.FrameStream()
+        self.freqs = analysis.frame_frequencies(sr)
+        self.lowest = np.inf
+        self.highest = -np.inf
+
+    def add_frames(self, magnitudes):
+        if len(magnitudes):
+            cent = analysis.frame_centroids(magnitudes, self.freqs)
+            self.lowest = min(self.lowest, cent.min())
+            self.highest = max(self.highest, cent.max())
+
+    def update(self, block):
+        self.add_frames(self.frames.update(block))
+
+    def centroid_range(self):
+        # the last frames reach into the padding at the end
+        if self.frames is not None:
+            self.add_frames(self.frames.finish())
+            self.frames = None
+        return self.lowest, self.highest
+
+'''------------------------------------
+SILENCE TRIM FINDER:
+    the second pass over a recording (same frames as librosa.effects.trim in trim_silence:
+    2-sample frames every 500 samples, zero padded at the edges)
+    update() receives a mono block,
+    bounds() returns the (start, end) of the trimmed audio
+
+    only the frames that can still be the first non-silent one are kept, so the memory stays constant
+------------------------------------'''
+class TrimFinder:
+    def __init__(self):
+        self.position = 0
+
+        # sample before the current block (the zero padding at the start)
+        self.previous = 0.0
+
+        # loudest frame power so far (none yet)
+        self.ref = -1.0
+
+        # (frame, power) of the frames louder than every frame before them
+        self.candidates = []
+
+        # latest frame that is loud enough compared to every frame before it
+        self.last = None
+
+    def loud(self, power, ref):
+        return (10 * np.log10(np.maximum(AMIN, power)) - 10 * np.log10(np.maximum(AMIN, ref))) > -TOP_DB
+
+    def update(self, block):
+        block_start = self.position
+        self.position += len(block)
+        self.add_frames(block_start, np.concatenate([[self.previous], block]))
+        if len(block):
+            self.previous = block[-1]
+
+    def add_frames(self, block_start, y):
+        # y[0] is the sample right before the block
+        first = -(-block_start // TRIM_HOP_LENGTH)
+        frames = np.arange(first * TRIM_HOP_LENGTH, block_start + len(y) - 1, TRIM_HOP_LENGTH)
+        if len(frames) == 0:
+            return
+
+        local = frames - block_start + 1
+        power = (y[local - 1].astype(np.float64)**2 + y[local].astype(np.float64)**2) / 2
+
+        running = np.maximum.accumulate(np.maximum(power, self.ref))
+        loud = self.loud(power, running)
+
+        # only frames that beat every frame before them can be the first loud frame
+        records = power > np.concatenate([[self.ref], running[:-1]])
+        for frame, p in zip(frames[records], power[records]):
+            self.candidates.append((frame // TRIM_HOP_LENGTH, p))
+
+        self.ref = running[-1]
+        self.candidates = [c for c in self.candidates if self.loud(c[1], self.ref)]
+
+        if np.any(loud):
+            self.last = frames[np.flatnonzero(loud)[-1]] // TRIM_HOP_LENGTH
+
+    def bounds(self):
+        # the last frame sits on the end of the audio when its length is a multiple of the hop
+        if self.position % TRIM_HOP_LENGTH == 0:
+            self.add_frames(self.position, np.array([self.previous, 0.0]))
+
+        if not self.candidates or self.last is None:
+            return 0, 0
+
+        start = self.candidates[0][0] * TRIM_HOP_LENGTH
+        end = min(self.position, (self.last + 1) * TRIM_HOP_LENGTH)
+        return start, end
+
+'''------------------------------------
+STREAMING SPLITTER:
+    receives the mono blocks, the sample rate, filename (for the output), output folder,
+    the path of the raw recording and where the blocks come from in it (for the manifest,
+    origin: see manifest.write_manifest),
+    writes each bark sequence as soon as it is closed, and the manifest of them at the end,
+    returns the filenames of the bark sequences written
+
+    only the audio of the current (possibly open) sequence is kept
+------------------------------------'''
+def split_blocks(blocks, sr, fileName, folder='data', source=None, origin=None):
+    tracker = segmenter.SequenceTracker(sr)
+
+    # samples from buffer_start onwards that might still be part of a sequence
+    buffer = []
+    buffer_start = 0
+    written = []
+    entries = []
+
+    def export(start, end):
+        audio = np.concatenate(buffer)[start - buffer_start:end - buffer_start]
+        filename = folder + '/split-' + fileName + '-' + str(len(written)) + '.wav'
+        write(filename, sr, audio)
+        written.append(filename)
+        entries.append(manifest.split_entry(filename, start, end, sr, audio))
+
+    for block in blocks:
+        buffer.append(block)
+        sequences, peaks = tracker.feed(block)
+
+        for peak in peaks:
+            print("found a peak in second", peak/sr)
+
+        for start, end in sequences:
+            export(start, end)
+
+        # drops the audio before the start of the current sequence
+        if tracker.startidx > buffer_start:
+            audio = np.concatenate(buffer)[tracker.startidx - buffer_start:]
+            buffer = [audio]
+            buffer_start = tracker.startidx
+
+    for start, end in tracker.finish():
+        export(start, end)
+
+    manifest.write_manifest(fileName, source, sr, entries, folder, origin)
+
+    return written
+
+'''------------------------------------
+STREAMING ANALYSIS:
+    receives the path of a raw wav file and the block size,
+    returns the normalization gain (in dB), the working sample rate and the lowest
+    and highest spectral centroid of the normalized mono audio at that rate
+    (what reduce_noise_centroid_mb in preprocess.py measures on the whole time series)
+------------------------------------'''
+def analyze(file_name, block_size=BLOCK_SIZE):
+    fs = read_rate(file_name)
+    sr = audio.working_rate(fs)
+
+    # 1. loudness of the raw recording
+    loudness = Loudness()
+    for block in read_blocks(file_name, block_size):
+        loudness.update(block)
+
+    gain = constants.TARGET_DBFS - loudness.dbfs()
+    if not np.isfinite(gain):
+        gain = 0.0
+
+    # 2. centroids of the audio the filters are run on
+    analyzer = Analyzer(sr)
+    blocks = mono(normalized(read_blocks(file_name, block_size), gain))
+    for block in resampled(blocks, audio.Resampler(fs, sr)):
+        analyzer.update(block)
+
+    threshold_l, threshold_h = analyzer.centroid_range()
+
+    return gain, sr, threshold_l, threshold_h
+
+'''------------------------------------
+STREAMING PREPROCESSOR:
+    receives the path of a raw wav file and the output folder,
+    normalizes, reduces the noise, trims the silence and splits the recording
+    while only holding a few blocks (and the current bark sequence) in memory,
+    returns the filenames of the splits
+
+    the recording is read four times:
+        1. loudness
+        2. spectral centroid range of the normalized audio at the working sample rate
+        3. silence trim bounds of the filtered audio
+        4. filtering again and splitting
+    the audio is resampled to the working sample rate (audio.working_rate) before the filters,
+    the noise reduction is always the scipy chain (see BACKEND)
+------------------------------------'''
+def preprocess_stream(file_name, folder='data', block_size=BLOCK_SIZE):
+    fileName = file_name.split('/')[-1].split('.')[0]
+    print("streaming **", fileName, "**")
+
+    if not os.path.exists(folder):
+        os.mkdir(folder)
+
+    fs = read_rate(file_name)
+
+    # 1. and 2. loudness and centroids
+    gain, sr, threshold_l, threshold_h = analyze(file_name, block_size)
+
+    def cleaned():
+        blocks = mono(normalized(read_blocks(file_name, block_size), gain))
+        blocks = resampled(blocks, audio.Resampler(fs, sr))
+        return filtered(blocks, filters.NoiseReductionChain(threshold_l, threshold_h))
+
+    # 3. silence trimming bounds
+    trim = TrimFinder()
+    for block in cleaned():
+        trim.update(block)
+    start, end = trim.bounds()
+
+    # 4. splitting
+    origin = { 'source_sr' : fs, 'trim_start' : start }
+    written = split_blocks(trimmed(cleaned(), start, end), sr, fileName, folder, file_name, origin)
+
+    print(len(written), " barks detected!")
+
+    return written
+
+'''------------------------------------
+STREAM AND BATCH COMPARISON:
+    receives a random seed, the sample rate of the synthetic recording and its duration (in seconds),
+    preprocesses the same 16-bit recording streamed and in memory (preprocess.preprocess_file,
+    scipy backend) in a temporary folder,
+    returns if the centroid ranges, the amount of splits and their samples agree
+------------------------------------'''
+def check_against_batch(seed, fs=44100, seconds=8.0, block_size=5000):
+    import tempfile
+    from scipy.io.wavfile import read
+    import preprocess
+
+    # barks after half a second of silence (so the trim bounds are tested too)
+    y = np.concatenate([np.zeros(fs // 2, np.float32), analysis.pitched_barks(seed, fs, seconds)[0]])
+    backend = constants.NOISE_REDUCTION_BACKEND
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        constants.NOISE_REDUCTION_BACKEND = 'scipy'
+        try:
+            # preprocess_file writes its splits to 'data' (made by preprocess.makeFolders)
+            os.mkdir('data')
+            write('recording.wav', fs, (y * 20000).astype(np.int16))
+
+            # centroids of the normalized audio at the working rate, like reduce_noise_centroid_mb
+            data = read('recording.wav')[1]
+            audio.normalize(data, constants.TARGET_DBFS)
+            resampled_y, sr = audio.at_working_rate(audio.to_float(data), fs)
+            expected = analysis.SignalAnalysis(resampled_y, sr).centroid_range()
+            centroids = analyze('recording.wav', block_size)[2:]
+
+            batch = [read(f)[1] for f in preprocess.preprocess_file('recording.wav')]
+            streamed = [read(f)[1] for f in preprocess_stream('recording.wav', 'streamed', block_size)]
+        finally:
+            constants.NOISE_REDUCTION_BACKEND = backend
+            os.chdir(cwd)
+
+    centroids_ok = np.allclose(centroids, expected, rtol=1e-3)
+    count_ok = len(batch) == len(streamed)
+    samples_ok = count_ok and all(abs(len(a) - len(b)) <= TRIM_HOP_LENGTH
+        and np.max(np.abs(a[:min(len(a), len(b))] - b[:min(len(a), len(b))])) < 1e-2
+        for a, b in zip(batch, streamed))
+
+    print("seed", seed, "|", fs, "Hz | centroid range: %.2f-%.2f Hz streamed, %.2f-%.2f Hz batch"
+        % (centroids + expected), "|", len(streamed), "splits streamed,", len(batch), "batch")
+
+    return centroids_ok and count_ok and samples_ok
+
+
+# compares the streamed preprocessing with the in-memory one on synthetic recordings
+# at a sample rate that gets resampled (exits with 1 if they do not agree)
+# usage: python stream.py
+if __name__ == '__main__':
+    import sys
+
+    ok = all([check_against_batch(seed) for seed in range(3)])
+    if not ok:
+        print("the streamed preprocessing does not match the in-memory one")
+        sys.exit(1)
+    print("the streamed preprocessing matches the in-memory one")
@@ -0,0 +1,56 @@
+# used in running the work in worker processes
+import concurrent.futures
+import concurrent.futures.process
+
+# used in reporting the errors of the calls
+import traceback
+
+'''------------------------------------
+POOL RESULTS:
+    receives a function, the arguments of every call to it (a list of tuples)
+    and the amount of worker processes,
+    yields the result of every call and the error (None if there was no error, the result is None otherwise),
+    one call at a time and in the same order as the arguments
+
+    a worker that dies (killed for using too much memory, crashed) breaks the whole pool,
+    so the calls that did not finish are run again in a fresh pool: the first of them alone
+    (a crash there is its own, it is reported as its error), the rest with every worker again
+------------------------------------'''
+def pool_results(function, calls, jobs):
+    done = 0
+
+    while done < len(calls):
+        broken = False
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(function, *args) for args in calls[done:]]
+
+            for future in futures:
+                try:
+                    result = future.result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    broken = True
+                    break
+                except Exception as e:
+                    result = None
+                    error = traceback.format_exc()
+                else:
+                    error = None
+
+                done += 1
+                yield result, error
+
+        if not broken:
+            break
+
+        # the first call that did not finish, alone in its own pool
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                result, error = pool.submit(function, *calls[done]).result(), None
+            except concurrent.futures.process.BrokenProcessPool:
+                result, error = None, "the worker process died (killed or crashed)\n"
+            except Exception as e:
+                result, error = None, traceback.format_exc()
+
+        done += 1
+        yield result, error